@@ -0,0 +1,74 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from course import Table
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ['docx', 'lxml', 'latex2mathml', 'numpy', 'matplotlib', 'texttable']
+
+MODEL_ONLY = '''
+import sys
+import mc
+print(mc.chapter_10.N_kr)
+print(','.join(e for e in {heavy!r} if e in sys.modules))
+'''
+
+FULL_REPORT = '''
+import runpy
+import sys
+runpy.run_path('mc.py', run_name='__main__')
+print(','.join(e for e in {heavy!r} if e in sys.modules))
+'''
+
+
+def run(args, cwd):
+    t = time.perf_counter()
+    result = subprocess.run(args, cwd=cwd, capture_output=True, text=True, env=dict(os.environ, MPLBACKEND='Agg'))
+    elapsed = time.perf_counter() - t
+    if result.returncode != 0:
+        print('error, benchmark command failed', args)
+        print(result.stderr)
+        sys.exit(1)
+    return elapsed, result.stdout
+
+
+def bench(repeat=3):
+    """
+    Холодный запуск отдельного процесса: только числовая модель (import mc и chapter_10.N_kr)
+    против полной генерации отчёта. Копия проекта без кэша формул, время - минимум из repeat запусков.
+    Загруженные тяжёлые модули проверяются в каждом процессе, модель не должна загружать ни одного
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ['mc.py', 'course.py', 'MML2OMML.XSL', 'gerb.png']:
+            shutil.copy(os.path.join(HERE, name), directory)
+
+        model = []
+        model_loaded = ''
+        for _ in range(repeat):
+            elapsed, out = run([sys.executable, '-c', MODEL_ONLY.format(heavy=HEAVY_MODULES)], directory)
+            model.append(elapsed)
+            model_loaded = out.splitlines()[-1]
+
+        report = []
+        report_loaded = ''
+        for _ in range(repeat):
+            shutil.rmtree(os.path.join(directory, '.formula_cache'), ignore_errors=True)
+            elapsed, out = run([sys.executable, '-c', FULL_REPORT.format(heavy=HEAVY_MODULES)], directory)
+            report.append(elapsed)
+            report_loaded = out.splitlines()[-1]
+
+    if model_loaded:
+        print('error, numeric model loaded', model_loaded)
+
+    table = Table('Запуск', 'Время, с', 'Загружены')
+    table.add_row('Только модель', round(min(model), 3), model_loaded or '-')
+    table.add_row('Полный отчёт', round(min(report), 3), report_loaded or '-')
+    return table
+
+
+if __name__ == '__main__':
+    print(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 3))
@@ -1,13 +1,14 @@
-import texttable
+import weakref
 from typing import *
 
 
 class Value:
     """
     Значение, которое имеет переменные и/или постоянные затрты
-    Может иметь потомков
+    Может иметь потомков, суммы потомков запоминаются и сбрасываются вверх по родителям при изменении
+    Поиск по имени идёт через индекс имён поддерева, который строится при первом обращении
     """
-    __slots__ = ['name', '_const', '_variable', 'children', '_display_name']
+    __slots__ = ['name', '_const', '_variable', 'children', '_display_name', '_parents', '_sum_const', '_sum_variable', '_index', '__weakref__']
 
     def __init__(self, name: str, const: float = 0, variable: float = 0, display_name: str = None):
         self.name = name
@@ -15,6 +16,11 @@ class Value:
         self._variable = variable
         self.children = None
         self._display_name = display_name
+        # one value can be a child of several trees, parents are weak so a subtree does not keep its trees alive
+        self._parents = None
+        self._sum_const = None
+        self._sum_variable = None
+        self._index = None
 
     def add_child(self, variable):
         """
@@ -22,11 +28,61 @@ class Value:
         :param variable: Value тип данных
         :return: Value, переданное в функцию
         """
-        if self.children is None:
+        leaf = self.children is None
+        if leaf:
             self.children = []
         self.children.append(variable)
+        if variable._parents is None:
+            variable._parents = []
+        else:
+            # drop trees that are gone, so a shared value does not collect references to every tree it was in
+            variable._parents = [ref for ref in variable._parents if ref() is not None]
+        variable._parents.append(weakref.ref(self))
+        # without cached sums and index there are no cached ancestors, unless the value was a leaf until now
+        if leaf or self._sum_const is not None or self._sum_variable is not None or self._index is not None:
+            self._invalidate(True)
         return variable
 
+    def _invalidate(self, names=False):
+        self._sum_const = None
+        self._sum_variable = None
+        if names:
+            self._index = None
+        if self._parents is None:
+            return
+        alive = []
+        for ref in self._parents:
+            parent = ref()
+            if parent is None:
+                continue
+            alive.append(ref)
+            # a parent without cached sums (and index, when names change) has no cached ancestors either
+            if parent._sum_const is not None or parent._sum_variable is not None or names and parent._index is not None:
+                parent._invalidate(names)
+        self._parents = alive
+
+    def _name_index(self):
+        """
+        Индекс имя -> Value по поддереву, в порядке старого поиска: сам, прямые потомки, затем поддеревья потомков.
+        Индекс собирается из индексов потомков, поэтому индекс родителя есть только при индексах потомков
+        """
+        if self._index is None:
+            index = {self.name: self}
+            if self.children is not None:
+                for e in self.children:
+                    self._index_name(index, e.name, e)
+                for e in self.children:
+                    for name, node in e._name_index().items():
+                        self._index_name(index, name, node)
+            self._index = index
+        return self._index
+
+    def _index_name(self, index, name, node):
+        found = index.setdefault(name, node)
+        # one value reachable by two paths is not a duplicate
+        if found is not node:
+            print('error, duplicate name {} in {}, first found is used'.format(name, self.name))
+
     @property
     def const(self) -> float:
         """
@@ -34,10 +90,20 @@ class Value:
         """
         if self.children is None:
             return self._const
-        s = 0
-        for child in self.children:
-            s += child.const
-        return s
+        if self._sum_const is None:
+            s = 0
+            for child in self.children:
+                s += child.const
+            self._sum_const = s
+        return self._sum_const
+
+    @const.setter
+    def const(self, value):
+        if self.children is not None:
+            print('error, const of {} is a sum of children'.format(self.name))
+            return
+        self._const = value
+        self._invalidate()
 
     @property
     def variable(self) -> float:
@@ -46,10 +112,20 @@ class Value:
         """
         if self.children is None:
             return self._variable
-        s = 0
-        for child in self.children:
-            s += child.variable
-        return s
+        if self._sum_variable is None:
+            s = 0
+            for child in self.children:
+                s += child.variable
+            self._sum_variable = s
+        return self._sum_variable
+
+    @variable.setter
+    def variable(self, value):
+        if self.children is not None:
+            print('error, variable of {} is a sum of children'.format(self.name))
+            return
+        self._variable = value
+        self._invalidate()
 
     @property
     def total(self) -> float:
@@ -58,11 +134,25 @@ class Value:
         """
         return self.const + self.variable
 
+    def __getstate__(self):
+        return self.name, self._const, self._variable, self.children, self._display_name
+
+    def __setstate__(self, state):
+        self.name, self._const, self._variable, children, self._display_name = state
+        self.children = None
+        self._parents = None
+        self._sum_const = None
+        self._sum_variable = None
+        self._index = None
+        if children is not None:
+            for child in children:
+                self.add_child(child)
+
     def head(self, deep: int = 0):
         if deep == 0 or self.children is None:
-            return Value(self.name, self.const, self.variable, self._display_name)
+            return type(self)(self.name, self.const, self.variable, self._display_name)
         else:
-            nc = Value(self.name, display_name=self._display_name)
+            nc = type(self)(self.name, display_name=self._display_name)
             for e in self.children:
                 nc.add_child(e.head(deep - 1))
             return nc
@@ -70,18 +160,7 @@ class Value:
     def __getitem__(self, item):
         if type(item) is not str:
             return None
-        if item == self.name:
-            return self
-        if self.children is None:
-            return None
-        for e in self.children:
-            if e.name == item:
-                return e
-        for e in self.children:
-            r = e[item]
-            if r:
-                return r
-        return None
+        return self._name_index().get(item)
 
     def __str__(self, deep=0):
         c = self.const
@@ -98,41 +177,313 @@ class Value:
         return s
 
     def __add__(self, other):
-        if type(other) == Value:
+        if isinstance(other, Value):
             return self.total + other.total
 
         return self.total + other
 
 
+class FlatValue:
+    """
+    Плоское представление дерева Value: узлы в прямом порядке обхода, массивы номера родителя, глубины,
+    номера имени и затрат листьев (у внутренних узлов 0). Затраты могут быть двумерными - столбец на сценарий
+    """
+    __slots__ = ['names', 'display_names', 'name_id', 'parent', 'depth', 'const', 'variable', '_index']
+
+    def __init__(self, names, display_names, name_id, parent, depth, const, variable):
+        import numpy
+        self.names: List[str] = names
+        self.display_names: List[str] = display_names
+        self.name_id = numpy.asarray(name_id, dtype=numpy.int64)
+        self.parent = numpy.asarray(parent, dtype=numpy.int64)
+        self.depth = numpy.asarray(depth, dtype=numpy.int64)
+        self.const = numpy.array(const, dtype=numpy.float64)
+        self.variable = numpy.array(variable, dtype=numpy.float64)
+        self._index = None
+
+    @staticmethod
+    def _flatten(value: Value):
+        nodes, parent, depth = [], [], []
+        stack = [(value, -1, 0)]
+        while stack:
+            node, p, d = stack.pop()
+            parent.append(p)
+            depth.append(d)
+            nodes.append(node)
+            if node.children is not None:
+                i = len(nodes) - 1
+                for child in reversed(node.children):
+                    stack.append((child, i, d + 1))
+        return nodes, parent, depth
+
+    @staticmethod
+    def from_value(value: Value):
+        """
+        Плоская копия дерева
+        :param value: корень дерева
+        """
+        return FlatValue.from_values([value], False)
+
+    @staticmethod
+    def from_values(values: List[Value], stack: bool = True):
+        """
+        Плоская копия нескольких деревьев одной формы, затраты - столбец на дерево
+        :param values: корни деревьев с одинаковыми именами узлов в том же порядке
+        :param stack: False - одно дерево, одномерные затраты
+        :return: FlatValue или None, если формы деревьев различаются
+        """
+        nodes, parent, depth = FlatValue._flatten(values[0])
+        names, ids, name_id = [], {}, []
+        for node in nodes:
+            if node.name not in ids:
+                ids[node.name] = len(names)
+                names.append(node.name)
+            name_id.append(ids[node.name])
+
+        const, variable = [], []
+        for value in values:
+            other, other_parent, _ = FlatValue._flatten(value) if value is not values[0] else (nodes, parent, depth)
+            if other_parent != parent or any(a.name != b.name for a, b in zip(nodes, other)):
+                print('error, tree {} has another shape than {}'.format(value.name, values[0].name))
+                return None
+            const.append([0 if e.children is not None else e.const for e in other])
+            variable.append([0 if e.children is not None else e.variable for e in other])
+
+        if stack:
+            const, variable = list(zip(*const)), list(zip(*variable))
+        else:
+            const, variable = const[0], variable[0]
+        return FlatValue(names, [e._display_name for e in nodes], name_id, parent, depth, const, variable)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def _column_shape(self):
+        return (-1,) + (1,) * (self.const.ndim - 1)
+
+    def leaves(self):
+        """
+        Маска листьев
+        """
+        import numpy
+        leaf = numpy.ones(len(self), dtype=bool)
+        leaf[self.parent[1:]] = False
+        return leaf
+
+    def sums(self):
+        """
+        Суммы по поддеревьям для каждого узла, в том же порядке сложения потомков, что и у Value
+        :return: (постоянные, переменные)
+        """
+        import numpy
+        leaf = self.leaves().reshape(self._column_shape())
+        result = []
+        for values in (self.const, self.variable):
+            s = numpy.where(leaf, values, 0.)
+            # deepest level first, numpy.add.at adds the children of one parent in their order
+            for d in range(int(self.depth.max()), 0, -1):
+                nodes = numpy.flatnonzero(self.depth == d)
+                numpy.add.at(s, self.parent[nodes], s[nodes])
+            result.append(s)
+        return result[0], result[1]
+
+    def totals(self):
+        """
+        Полные затраты каждого поддерева
+        """
+        c, v = self.sums()
+        return c + v
+
+    def percents(self, total=None):
+        """
+        Доля полных затрат каждого поддерева в процентах, как в PercentTable
+        :param total: база процентов, по умолчанию - полные затраты корня
+        """
+        t = self.totals()
+        if total is None:
+            total = t[0]
+        return t / total * 100
+
+    def head(self, deep: int = 0):
+        """
+        Дерево до глубины deep, узлы на глубине deep становятся листьями с суммами поддеревьев, как Value.head
+        """
+        import numpy
+        keep = self.depth <= deep
+        cut = (self.depth == deep).reshape(self._column_shape())
+        c, v = self.sums()
+        position = numpy.cumsum(keep) - 1
+        parent = numpy.where(self.parent >= 0, position[self.parent], -1)
+        return FlatValue(self.names, [e for e, k in zip(self.display_names, keep) if k], self.name_id[keep], parent[keep],
+                         self.depth[keep], numpy.where(cut, c, self.const)[keep], numpy.where(cut, v, self.variable)[keep])
+
+    def __getitem__(self, item):
+        """
+        Номер узла по имени, в порядке поиска Value
+        :return: номер узла или None
+        """
+        if type(item) is not str:
+            return None
+        if self._index is None:
+            children = [[] for _ in range(len(self))]
+            for i, p in enumerate(self.parent.tolist()):
+                if p >= 0:
+                    children[p].append(i)
+            name_id = self.name_id.tolist()
+
+            def index(i):
+                found = {self.names[name_id[i]]: i}
+                for e in children[i]:
+                    found.setdefault(self.names[name_id[e]], e)
+                for e in children[i]:
+                    for name, node in index(e).items():
+                        found.setdefault(name, node)
+                return found
+
+            self._index = index(0)
+        return self._index.get(item)
+
+    def to_value(self, column: int = None) -> Value:
+        """
+        Обратное преобразование в дерево Value
+        :param column: номер сценария для двумерных затрат
+        """
+        const = self.const if column is None else self.const[:, column]
+        variable = self.variable if column is None else self.variable[:, column]
+        leaf = self.leaves()
+        nodes = []
+        for i, p in enumerate(self.parent.tolist()):
+            c, v = (float(const[i]), float(variable[i])) if leaf[i] else (0, 0)
+            nodes.append(Value(self.names[self.name_id[i]], c, v, self.display_names[i]))
+            if p >= 0:
+                nodes[p].add_child(nodes[-1])
+        return nodes[0]
+
+
+class ValueBatch(Value):
+    """
+    Дерево Value, в листьях которого массивы затрат - по значению на сценарий.
+    const, variable, total и head считаются сразу для всех сценариев
+    """
+    __slots__ = []
+
+    @staticmethod
+    def from_flat(flat: FlatValue):
+        """
+        Дерево из двумерного FlatValue, строка затрат узла становится массивом листа
+        """
+        leaf = flat.leaves()
+        nodes = []
+        for i, p in enumerate(flat.parent.tolist()):
+            if leaf[i]:
+                nodes.append(ValueBatch(flat.names[flat.name_id[i]], flat.const[i], flat.variable[i], flat.display_names[i]))
+            else:
+                nodes.append(ValueBatch(flat.names[flat.name_id[i]], display_name=flat.display_names[i]))
+            if p >= 0:
+                nodes[p].add_child(nodes[-1])
+        return nodes[0]
+
+    @staticmethod
+    def from_values(values: List[Value]):
+        """
+        Пакет из деревьев одной формы, сценарий i - дерево values[i]
+        :return: ValueBatch или None, если формы деревьев различаются
+        """
+        flat = FlatValue.from_values(values)
+        if flat is None:
+            return None
+        return ValueBatch.from_flat(flat)
+
+    @property
+    def size(self) -> int:
+        """
+        Количество сценариев. Лист с числом вместо массива одинаков во всех сценариях
+        """
+        import numpy
+        shapes = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.children is None:
+                shapes += [numpy.shape(node._const), numpy.shape(node._variable)]
+            else:
+                stack += node.children
+        shape = numpy.broadcast_shapes(*shapes)
+        return shape[0] if shape else 1
+
+    def scenario(self, i: int) -> Value:
+        """
+        Обычное дерево Value для сценария i
+        """
+        if self.children is None:
+            return Value(self.name, ValueBatch._at(self._const, i), ValueBatch._at(self._variable, i), self._display_name)
+        nc = Value(self.name, display_name=self._display_name)
+        for e in self.children:
+            nc.add_child(e.scenario(i))
+        return nc
+
+    @staticmethod
+    def _at(values, i):
+        return float(values[i]) if getattr(values, 'ndim', 0) else float(values)
+
+    def __str__(self, deep=0, size=None):
+        import numpy
+        if size is None:
+            size = self.size
+        t = numpy.broadcast_to(self.total, (size,))
+        s = '  ' * deep + '{}, сценариев: {}, все: {:,.2f} .. {:,.2f}'.format(self._display_name if self._display_name else self.name, size, t.min(), t.max())
+        if self.children is not None:
+            for child in self.children:
+                s += '\n' + child.__str__(deep + 1, size)
+        return s
+
+
 class _TableRow:
-    __slots__ = ['table', 'data']
+    """
+    Строка таблицы - представление строки index поверх столбцов таблицы
+    """
+    __slots__ = ['table', 'index']
 
-    def __init__(self, table, data):
+    def __init__(self, table, index):
         self.table = table
-        self.data = data
+        self.index = index
+
+    @property
+    def data(self) -> tuple:
+        return tuple(e[self.index] for e in self.table._columns)
 
     def __len__(self):
-        return len(self.data)
+        return len(self.table.headers)
 
     def __getitem__(self, item):
         if type(item) == int:
-            if item < 0 or item >= len(self.data):
-                print('error, index {} out of range [0, {}]'.format(item, len(self.data) - 1))
+            if item < 0 or item >= len(self.table.headers):
+                print('error, index {} out of range [0, {}]'.format(item, len(self.table.headers) - 1))
                 return 0
-            return self.data[item]
+            return self.table._columns[item][self.index]
         elif type(item) == str:
             if item not in self.table.headers_map:
                 print('error, name {} is not exists in table. Header is: {}'.format(item, self.table.headers))
                 return 0
-            return self.data[self.table.headers_map[item]]
+            return self.table._columns[self.table.headers_map[item]][self.index]
+
+    def __setitem__(self, item, value):
+        index = self.table.headers_map.get(item) if type(item) == str else item
+        if index is None or index < 0 or index >= len(self.table.headers):
+            print('error, cell {} is not exists in table. Header is: {}'.format(item, self.table.headers))
+            return
+        self.table._columns[index][self.index] = value
+        self.table._arrays.pop(self.table.headers[index], None)
 
 
 class Table:
     """
     Таблица, можно извлекать столбцы по имени,
-    и считать сумму всех строк с помощью callback
+    и считать сумму всех строк с помощью callback или выражения над столбцами.
+    Данные хранятся по столбцам в списках Python, чтобы модель считалась без numpy, строки - представления поверх них.
+    Столбцы меняются только через add_row и строки, иначе запомненные массивы column устареют
     """
-    __slots__ = ['headers', 'headers_map', 'rows']
+    __slots__ = ['headers', 'headers_map', '_columns', '_rows', '_arrays']
 
     def __init__(self, *args):
         self.headers: List[str] = []
@@ -145,7 +496,20 @@ class Table:
             self.headers.append(i)
             self.headers_map[i] = total
             total += 1
-        self.rows: List[_TableRow] = []
+        self._columns: List[list] = [[] for _ in self.headers]
+        self._rows = ()
+        # numpy copies of columns, built on first request and dropped when the column changes
+        self._arrays = {}
+
+    @property
+    def rows(self) -> Tuple[_TableRow, ...]:
+        """
+        Строки таблицы, строки добавляются только через add_row
+        """
+        size = len(self)
+        if len(self._rows) != size:
+            self._rows = self._rows + tuple(_TableRow(self, i) for i in range(len(self._rows), size))
+        return self._rows
 
     def add_row(self, *args):
         """
@@ -156,7 +520,9 @@ class Table:
         if len(args) != len(self.headers):
             print('error, row len != headers len', len(args), len(self.headers))
             return
-        self.rows.append(_TableRow(self, args))
+        for column, value in zip(self._columns, args):
+            column.append(value)
+        self._arrays.clear()
 
     def get_column(self, name):
         """
@@ -168,41 +534,99 @@ class Table:
         if name not in self.headers_map.keys():
             print('header not found')
             return []
-        target = self.headers_map[name]
-        return [e[target] for e in self.rows]
+        return list(self._columns[self.headers_map[name]])
+
+    def column(self, name):
+        """
+        Копия столбца в виде numpy массива только для чтения, копия запоминается до изменения столбца
+
+        :param name: названеи столбца
+        :return: numpy массив или None в случае ошибки
+        """
+        if name not in self.headers_map:
+            print('error, header {} not found. Header is: {}'.format(name, self.headers))
+            return None
+        array = self._arrays.get(name)
+        if array is None:
+            import numpy
+            values = self._columns[self.headers_map[name]]
+            array = numpy.array(values)
+            # mixed or non-scalar cells stay Python objects, numpy would turn numbers among strings into strings
+            if array.ndim != 1 or array.dtype.kind not in 'biufU' or array.dtype.kind == 'U' and not all(type(e) == str for e in values):
+                array = numpy.empty(len(values), dtype=object)
+                array[:] = values
+            array.flags.writeable = False
+            self._arrays[name] = array
+        return array
+
+    def to_numpy(self):
+        """
+        Таблица в виде numpy массива записей, поля - заголовки столбцов
+        """
+        import numpy
+        return numpy.rec.fromarrays([self.column(e) for e in self.headers], names=self.headers)
 
     def calculate_sum(self, callback):
         """
         Вычисляет сумму, применяя переданную функцию к каждой строке.
-        Функции передаётся строка в качестве аргумента
+        Функции передаётся строка в качестве аргумента.
+        Вместо функции можно передать произведение столбцов и чисел, например 'cost*amount',
+        оно считается по спискам столбцов без объектов строк, с тем же порядком сложения строк
 
-        :param callback: функция для вычисления значения строки
+        :param callback: функция для вычисления значения строки или выражение
         :return: сумма всех строк
         """
+        if type(callback) == str:
+            return self._calculate_expression(callback)
         s = 0
         for i in self.rows:
             s += callback(i)
         return s
 
+    def _calculate_expression(self, expression):
+        factors = []
+        for factor in expression.split('*'):
+            factor = factor.strip()
+            if factor in self.headers_map:
+                factors.append(self._columns[self.headers_map[factor]])
+            else:
+                try:
+                    value = float(factor) if '.' in factor or 'e' in factor else int(factor)
+                except ValueError:
+                    print('error, name {} is not exists in table. Header is: {}'.format(factor, self.headers))
+                    return 0
+                factors.append([value] * len(self))
+        # plain python over the column lists: the same products and order of addition as the row loop, no numpy import
+        s = 0
+        for row in zip(*factors):
+            product = row[0]
+            for e in row[1:]:
+                product = product * e
+            s += product
+        return s
+
     def find(self, param_name, value) -> _TableRow:
-        for row in self.rows:
-            if row[param_name] == value:
-                return row
+        if param_name not in self.headers_map:
+            print('error, name {} is not exists in table. Header is: {}'.format(param_name, self.headers))
+            return None
+        for i, e in enumerate(self._columns[self.headers_map[param_name]]):
+            if e == value:
+                return self.rows[i]
 
     def filter(self, callback):
         return list(filter(callback, self.rows))
 
     def filter_table(self, callback):
-        rows = self.filter(callback)
         table = Table(*self.headers)
-        for i in rows:
-            table.rows.append(i)
+        for i in self.filter(callback):
+            table.add_row(*i.data)
         return table
 
     def __len__(self):
-        return len(self.rows)
+        return len(self._columns[0]) if self._columns else 0
 
     def __str__(self):
+        import texttable
         t = texttable.Texttable(max_width=200)
         t.header(self.headers)
         for row in self.rows:
@@ -237,6 +661,7 @@ class PercentTable:
         for i in self.rows:
             total += i.total
 
+        import texttable
         t = texttable.Texttable(max_width=200)
         t.header(['value', 'percent'])
 
@@ -330,6 +755,7 @@ class PerPercentTable:
         return len(self.rows)
 
     def __str__(self):
+        import texttable
         t = texttable.Texttable(max_width=200)
         t.set_cols_dtype([str] * 4)
         t.header(['name', 'percent', 'value', 'data'])
@@ -367,6 +793,7 @@ class CalculateTable:
         return zip(self.input_data, self.output_data)
 
     def __str__(self):
+        import texttable
         t = texttable.Texttable(max_width=200)
         t.header([str(e) for e in self.input_data])
         t.add_row([str(e) for e in self.output_data])
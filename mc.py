@@ -1,22 +1,59 @@
-import latex2mathml.converter
-import numpy as np
 import math
-
-from docx.oxml import ns
-from lxml import etree
-import matplotlib
-from matplotlib import pyplot as plt
+import re
+import sys
+import os
+import copy
+import hashlib
+import pathlib
+import sqlite3
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
-from docx import Document
-from docx.oxml import OxmlElement
-from docx.shared import Inches, Mm, Cm, Pt, RGBColor
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT, WD_BREAK
-from docx.enum.style import WD_STYLE_TYPE
-from docx.enum.section import WD_ORIENTATION
+
 from course import Table, Value, PerPercentTable, CalculateTable, ActivePassive, DirectCosts, WorkAndOther, ExtendedActivePassive
 
+# docx, lxml, latex2mathml, numpy and matplotlib are imported by load_report_dependencies
+# on the first document, formula or chart call, the numeric model does not need them.
+# Formula conversion alone (also in pool workers) imports only latex2mathml and lxml, see load_formula_dependencies
+latex2mathml = np = etree = matplotlib = plt = ns = None
+Document = OxmlElement = Inches = Mm = Cm = Pt = RGBColor = None
+WD_PARAGRAPH_ALIGNMENT = WD_BREAK = WD_STYLE_TYPE = WD_ORIENTATION = None
+
+
+def load_formula_dependencies():
+    """
+    Только latex2mathml и lxml - всё, что нужно для конвертации формул, без документа (для процессов пула)
+    """
+    global latex2mathml, etree
+    if etree is not None:
+        return
+    import latex2mathml.converter
+    from lxml import etree
+
+
+def load_report_dependencies():
+    global np, matplotlib, plt, ns, Document, OxmlElement, Inches, Mm, Cm, Pt, RGBColor, \
+        WD_PARAGRAPH_ALIGNMENT, WD_BREAK, WD_STYLE_TYPE, WD_ORIENTATION, document
+    if document is not None:
+        return
+    load_formula_dependencies()
+    import numpy as np
+    import matplotlib
+    from matplotlib import pyplot as plt
+    from docx import Document
+    from docx.oxml import ns
+    from docx.oxml import OxmlElement
+    from docx.shared import Inches, Mm, Cm, Pt, RGBColor
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT, WD_BREAK
+    from docx.enum.style import WD_STYLE_TYPE
+    from docx.enum.section import WD_ORIENTATION
+    document = Document()
+
+
 # formatting
-document = Document()
+document = None
 
 title_text = None
 subtitle_text = None
@@ -36,6 +73,7 @@ def init_styles():
     global main_text, title_text, table_name_text, subtitle_text, subtitle_2_text, \
         formula_style, formula_style_12, table_style, table_style_dense, \
         table_style_12, table_style_12_dense, table_style_10
+    load_report_dependencies()
     FONT_NAME = 'Times New Roman'
 
     def gen_paragraph_style(name, font_size, first_line_indent=0, space_before=0, space_after=0, alignment=WD_PARAGRAPH_ALIGNMENT.LEFT, base=None):
@@ -92,33 +130,825 @@ def dp(text='', style=None, no_indent=False):
     return p
 
 
-def latex_to_word(latex_input):
-    mathml = latex2mathml.converter.convert(latex_input)
-    tree = etree.fromstring(mathml)
-    xslt = etree.parse('MML2OMML.XSL')
-    transform = etree.XSLT(xslt)
-    new_dom = transform(tree)
-    return new_dom.getroot()
+MML2OMML_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'MML2OMML.XSL')
+
+# MML2OMML.XSL wraps the whole input into a single m:oMath, so formulas are converted
+# with a stylesheet importing it that emits one m:oMath per mml:math of a <batch> document
+MML2OMML_BATCH_XSL = '''<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
+    xmlns:mml="http://www.w3.org/1998/Math/MathML" xmlns:m="http://schemas.openxmlformats.org/officeDocument/2006/math">
+  <xsl:import href="{href}"/>
+  <xsl:template match="/">
+    <m:batch>
+      <xsl:for-each select="*/mml:math">
+        <m:oMath>
+          <xsl:apply-templates select="*"/>
+        </m:oMath>
+      </xsl:for-each>
+    </m:batch>
+  </xsl:template>
+</xsl:stylesheet>'''
+
+# compiled MathML -> OMML transform, shared by every formula of the process
+_mml2omml_transform = None
+mml2omml_compile_count = 0
+
+
+def get_mml2omml_transform():
+    global _mml2omml_transform, mml2omml_compile_count
+    if _mml2omml_transform is None:
+        load_formula_dependencies()
+        href = pathlib.Path(MML2OMML_PATH).as_uri()
+        _mml2omml_transform = etree.XSLT(etree.XML(MML2OMML_BATCH_XSL.format(href=href)))
+        mml2omml_compile_count += 1
+    return _mml2omml_transform
+
+
+class FormulaCache:
+    """
+    LRU кэш формул: LaTeX строка -> OMML элемент.
+    Хранит оригинал и всегда выдаёт копию, так как элемент переносится в документ
+    """
+    __slots__ = ['max_size', 'hits', 'misses', '_items']
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, latex):
+        element = self._items.get(latex)
+        if element is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(latex)
+        return copy.deepcopy(element)
+
+    def put(self, latex, element):
+        if self.max_size <= 0:
+            return
+        self._items[latex] = copy.deepcopy(element)
+        self._items.move_to_end(latex)
+        self._evict()
+
+    def resize(self, max_size: int):
+        self.max_size = max_size
+        self._evict()
+
+    def clear(self):
+        self._items.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self):
+        while len(self._items) > max(self.max_size, 0):
+            self._items.popitem(last=False)
+
+    @property
+    def stats(self):
+        return {'size': len(self._items), 'max_size': self.max_size, 'hits': self.hits, 'misses': self.misses}
+
+    def __len__(self):
+        return len(self._items)
+
+
+formula_cache = FormulaCache()
+
+
+class FormulaDiskCache:
+    """
+    Кэш OMML формул на диске (sqlite), сохраняется между запусками.
+    Ключ - хэш LaTeX строки, MML2OMML.XSL, версии latex2mathml и способа конвертации (emitter или XSLT).
+    Размер ограничен max_bytes, при переполнении удаляются давно не использованные формулы
+    """
+    __slots__ = ['path', 'max_bytes', '_salt', '_connection', '_pid']
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'omml.sqlite')
+        self.max_bytes = max_bytes
+        load_formula_dependencies()
+        with open(MML2OMML_PATH, 'rb') as f:
+            xsl_hash = hashlib.sha256(f.read()).hexdigest()
+        self._salt = (xsl_hash + '\0' + latex2mathml.__version__ + '\0').encode()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        # sqlite connections must not be shared between forked worker processes
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS formulas ('
+                               'key TEXT PRIMARY KEY, omml BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS formulas_last_used ON formulas (last_used)')
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def key(self, latex):
+        # an emitter result must not outlive the emitter being disabled or changed
+        path = 'emitter {}'.format(FORMULA_EMITTER_VERSION) if use_formula_emitter else 'xslt'
+        return hashlib.sha256(self._salt + path.encode() + b'\0' + latex.encode()).hexdigest()
+
+    def get(self, latex):
+        connection = self._connect()
+        key = self.key(latex)
+        row = connection.execute('SELECT omml FROM formulas WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        connection.execute('UPDATE formulas SET last_used = ? WHERE key = ?', (time.time(), key))
+        return etree.fromstring(row[0])
+
+    def put(self, latex, element):
+        connection = self._connect()
+        omml = etree.tostring(element)
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('INSERT OR REPLACE INTO formulas (key, omml, size, last_used) VALUES (?, ?, ?, ?)',
+                               (self.key(latex), omml, len(omml), time.time()))
+            self._evict(connection)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def _evict(self, connection):
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM formulas').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        keys = []
+        for key, size in connection.execute('SELECT key, size FROM formulas ORDER BY last_used'):
+            keys.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany('DELETE FROM formulas WHERE key = ?', keys)
+
+    def clear(self):
+        self._connect().execute('DELETE FROM formulas')
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._pid = None
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM formulas').fetchone()[0]
+
+
+formula_disk_cache = None
+
+
+def enable_formula_disk_cache(directory='.formula_cache', max_bytes=64 * 1024 * 1024):
+    global formula_disk_cache
+    if formula_disk_cache is not None:
+        formula_disk_cache.close()
+    formula_disk_cache = FormulaDiskCache(directory, max_bytes)
+    return formula_disk_cache
+
+
+def disable_formula_disk_cache():
+    global formula_disk_cache
+    if formula_disk_cache is not None:
+        formula_disk_cache.close()
+    formula_disk_cache = None
+
+
+class FormulaProfiler:
+    """
+    Время работы с формулами по разделам отчёта (функциям gen_*) и этапам.
+    Время пакетных этапов (parse, xslt, pool) делится поровну между формулами пакета.
+    Отложенная формула учитывается в разделе, который её запросил, повтор формулы - в своём разделе,
+    конвертация повторов (один раз) - в разделе первого запроса
+    """
+    __slots__ = ['timings', 'counts', 'sections']
+
+    STAGES = ['cache', 'emit', 'latex2mathml', 'parse', 'xslt', 'pool', 'template', 'append']
 
+    def __init__(self):
+        self.timings = {}
+        self.counts = {}
+        self.sections = {}
 
-def add_formula(latex, p=None, style=None):
+    @staticmethod
+    def current_section():
+        frame = sys._getframe(1)
+        while frame is not None:
+            if frame.f_code.co_name.startswith('gen_'):
+                return frame.f_code.co_name
+            frame = frame.f_back
+        return 'other'
+
+    def request(self, latex_list):
+        """
+        Учитывает формулы в разделе, который их запросил
+        :return: раздел, в отложенном режиме он хранится в очереди вместе с формулой
+        """
+        section = self.current_section()
+        self.counts[section] = self.counts.get(section, 0) + len(latex_list)
+        return section
+
+    def add(self, stage, seconds, latex_list=None, sections=None):
+        """
+        :param sections: разделы формул latex_list по порядку, иначе раздел из self.sections
+        (формулы, конвертируемые сейчас) или текущий раздел
+        """
+        if not latex_list:
+            self._add(self.current_section(), stage, seconds)
+            return
+        if sections is None:
+            sections = [self.sections.get(e) for e in latex_list]
+        section = None
+        for target in sections:
+            if target is None:
+                if section is None:
+                    section = self.current_section()
+                target = section
+            self._add(target, stage, seconds / len(latex_list))
+
+    def _add(self, section, stage, seconds):
+        key = (section, stage)
+        self.timings[key] = self.timings.get(key, 0.0) + seconds
+
+    def clear(self):
+        self.timings.clear()
+        self.counts.clear()
+        self.sections.clear()
+
+    def report(self):
+        """
+        Таблица разделов по убыванию общего времени и числа формул, время в мс
+        """
+        sections = {}
+        for (section, stage), seconds in self.timings.items():
+            sections.setdefault(section, {})[stage] = seconds
+        for section in self.counts.keys():
+            sections.setdefault(section, {})
+        stages = [e for e in FormulaProfiler.STAGES if any(e in v for v in sections.values())]
+
+        rows = [(sum(v.values()), self.counts.get(k, 0), k, v) for k, v in sections.items()]
+        rows.sort(key=lambda e: (-e[0], -e[1], e[2]))
+        total = sum(e[0] for e in rows)
+
+        table = Table('Раздел', 'Формул', *stages, 'Всего, мс', 'Доля, %')
+        for seconds, count, section, values in rows:
+            table.add_row(section, count, *[round(values.get(e, 0) * 1000, 1) for e in stages],
+                          round(seconds * 1000, 1), round(seconds / total * 100 if total else 0, 1))
+        return table
+
+
+formula_profiler = None
+
+
+def enable_formula_profiler():
+    global formula_profiler
+    formula_profiler = FormulaProfiler()
+    return formula_profiler
+
+
+def disable_formula_profiler():
+    global formula_profiler
+    formula_profiler = None
+
+
+M_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/math'
+M_T = '{' + M_NS + '}t'
+
+
+class UnsupportedFormula(Exception):
+    pass
+
+
+# LaTeX subset converted by latex_to_omml without MathML and XSLT, the result repeats MML2OMML.XSL output
+LATEX_TOKEN = re.compile(r'%[^\n]*|\s+|\\[A-Za-z]+|\\.|[0-9]+(?:\.[0-9]+)?|.', re.S)
+LATEX_LETTER = re.compile('[A-Za-zА-Яа-яЁёΑ-Ωα-ω]')
+LATEX_SYMBOLS = {
+    '\\cdot': ('mo', '·'), '\\sum': ('mo', '∑'), '\\%': ('mi', '%'), '\\ ': ('mtext', ' '),
+    '\\alpha': ('mi', 'α'), '\\beta': ('mi', 'β'), '\\gamma': ('mi', 'γ'), '\\delta': ('mi', 'δ'),
+}
+# '/' is left to the XSLT, it turns 'a/b' into a linear fraction depending on the whole row
+LATEX_OPERATORS = {'+': '+', '-': '−', '=': '=', ',': ',', '.': '.', '(': '(', ')': ')', '[': '[', ']': ']', '*': '*'}
+
+
+def _latex_tokens(latex):
+    tokens = []
+    for m in LATEX_TOKEN.finditer(latex):
+        token = m.group(0)
+        if token[0] == '%' or token.isspace():
+            if tokens and tokens[-1] in ('_', '^'):
+                # latex2mathml reads 'x_ 12' as x_{12}, but 'x_12' as x_1 followed by 2
+                raise UnsupportedFormula(latex)
+            continue
+        if token == '.' and latex[m.end():m.end() + 1] in tuple('0123456789'):
+            # latex2mathml turns '.5' after a number into an identifier
+            raise UnsupportedFormula(latex)
+        tokens.append(token)
+    return tokens
+
+
+class _LatexParser:
+    """
+    Разбор подмножества LaTeX в дерево узлов MathML, как его строит latex2mathml:
+    (тип, текст) для mi/mn/mo/mtext и (тип, [дети]) для mrow/msub/msup/msubsup/mfrac
+    """
+    __slots__ = ['tokens', 'i']
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.i = 0
+
+    def peek(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise UnsupportedFormula('unexpected end')
+        self.i += 1
+        return token
+
+    def row(self, closing=None):
+        nodes = []
+        while self.peek() != closing:
+            if self.peek() is None:
+                raise UnsupportedFormula('unclosed group')
+            nodes.append(self.scripts(self.atom()))
+        return nodes
+
+    def group(self):
+        self.next()
+        nodes = self.row('}')
+        self.next()
+        return 'mrow', nodes
+
+    def atom(self):
+        token = self.peek()
+        if token == '{':
+            return self.group()
+        self.next()
+        if token == '\\frac':
+            if self.peek() != '{':
+                raise UnsupportedFormula(token)
+            num = self.group()
+            if self.peek() != '{':
+                raise UnsupportedFormula(token)
+            return 'mfrac', [num, self.group()]
+        if token in LATEX_SYMBOLS:
+            return LATEX_SYMBOLS[token]
+        if token in LATEX_OPERATORS:
+            return 'mo', LATEX_OPERATORS[token]
+        if token[0] in '0123456789':
+            return 'mn', token
+        if LATEX_LETTER.fullmatch(token):
+            return 'mi', token
+        raise UnsupportedFormula(token)
+
+    def argument(self):
+        token = self.peek()
+        if token == '{':
+            return self.group()
+        if token is not None and LATEX_LETTER.fullmatch(token):
+            self.next()
+            return 'mi', token
+        if token is not None and token[0] in '0123456789':
+            # x_12 is x_1 followed by 2
+            self.next()
+            if len(token) > 1:
+                self.tokens.insert(self.i, token[1:])
+            return 'mn', token[0]
+        raise UnsupportedFormula(token)
+
+    def scripts(self, base):
+        sub = sup = None
+        if self.peek() == "'":
+            self.next()
+            sup = 'mi', '′'
+        while self.peek() in ('_', '^'):
+            token = self.next()
+            if token == '_' and sub is None:
+                sub = self.argument()
+            elif token == '^' and sup is None:
+                sup = self.argument()
+            else:
+                raise UnsupportedFormula(token)
+        if self.peek() == "'":
+            raise UnsupportedFormula("'")
+        if base == ('mo', '∑') and (sub is None or sup is None):
+            raise UnsupportedFormula('\\sum')
+        if sub is not None and sup is not None:
+            return 'msubsup', [base, sub, sup]
+        if sub is not None:
+            return 'msub', [base, sub]
+        if sup is not None:
+            return 'msup', [base, sup]
+        return base
+
+
+def _omml(parent, tag):
+    return etree.SubElement(parent, '{' + M_NS + '}' + tag)
+
+
+def _omml_row(parent, nodes):
+    """
+    Узлы строки в OMML. Подряд идущие mi/mn/mo сливаются в один m:r, пробелы mtext - в отдельный m:r с m:nor,
+    вложенный mrow разрывает слияние, сумма забирает следующий за ней mrow как m:e
+    """
+    text = []
+    text_kind = None
+
+    def flush():
+        if text:
+            r = _omml(parent, 'r')
+            if text_kind == 'mtext':
+                _omml(_omml(r, 'rPr'), 'nor')
+            _omml(r, 't').text = ''.join(text)
+            text.clear()
+
+    i = 0
+    while i < len(nodes):
+        kind, value = nodes[i]
+        i += 1
+        if kind in ('mi', 'mn', 'mo', 'mtext'):
+            if text_kind != kind and (text_kind == 'mtext' or kind == 'mtext'):
+                flush()
+            text_kind = kind
+            text.append(value)
+            continue
+        flush()
+        text_kind = None
+        if kind == 'mrow':
+            _omml_row(parent, value)
+        elif kind == 'mfrac':
+            f = _omml(parent, 'f')
+            _omml(_omml(f, 'fPr'), 'type').set('{' + M_NS + '}val', 'bar')
+            _omml_row(_omml(f, 'num'), value[0][1])
+            _omml_row(_omml(f, 'den'), value[1][1])
+        elif value[0] == ('mo', '∑'):
+            nary = _omml(parent, 'nary')
+            pr = _omml(nary, 'naryPr')
+            for tag, val in (('chr', '∑'), ('limLoc', 'subSup'), ('grow', '1'), ('subHide', 'off'), ('supHide', 'off')):
+                _omml(pr, tag).set('{' + M_NS + '}val', val)
+            _omml_script(_omml(nary, 'sub'), value[1])
+            _omml_script(_omml(nary, 'sup'), value[2])
+            e = _omml(nary, 'e')
+            if i < len(nodes) and nodes[i][0] == 'mrow':
+                _omml_row(e, nodes[i][1])
+                i += 1
+        else:
+            s = _omml(parent, {'msub': 'sSub', 'msup': 'sSup', 'msubsup': 'sSubSup'}[kind])
+            _omml_script(_omml(s, 'e'), value[0])
+            for tag, node in zip(('sub', 'sup') if kind != 'msup' else ('sup',), value[1:]):
+                _omml_script(_omml(s, tag), node)
+    flush()
+
+
+def _omml_script(parent, node):
+    _omml_row(parent, node[1] if node[0] == 'mrow' else [node])
+
+
+def latex_to_omml(latex):
+    """
+    OMML формулы без latex2mathml и XSLT, только для подмножества LaTeX из отчёта.
+    Для остальных формул бросает UnsupportedFormula
+    """
+    load_formula_dependencies()
+    parser = _LatexParser(_latex_tokens(latex))
+    nodes = parser.row()
+    element = etree.Element('{' + M_NS + '}oMath', nsmap={'m': M_NS})
+    _omml_row(element, nodes)
+    return element
+
+
+# formulas of the supported subset are built by latex_to_omml, the rest go through the XSLT
+use_formula_emitter = True
+# part of the disk cache key, bump when latex_to_omml output changes
+FORMULA_EMITTER_VERSION = 2
+
+
+def _omml_equal(a, b):
+    if a.tag != b.tag or dict(a.attrib) != dict(b.attrib) or (a.text or '') != (b.text or '') or len(a) != len(b):
+        return False
+    return all(_omml_equal(x, y) for x, y in zip(a, b))
+
+
+def check_formula_emitter(latex_list):
+    """
+    Сравнивает latex_to_omml с конвертацией через XSLT.
+    Возвращает таблицу формул, для которых результаты различаются, и число неподдерживаемых формул
+    """
+    global formula_profiler
+    latex_list = list(OrderedDict.fromkeys(latex_list))
+    # the reference conversion is not part of the report, keep it out of the profile
+    profiler, formula_profiler = formula_profiler, None
+    try:
+        reference = _convert_latex_many_xslt(latex_list)
+    finally:
+        formula_profiler = profiler
+    mismatches = Table('Формула', 'OMML')
+    unsupported = 0
+    for latex, expected in zip(latex_list, reference):
+        try:
+            element = latex_to_omml(latex)
+        except UnsupportedFormula:
+            unsupported += 1
+            continue
+        if not _omml_equal(element, expected):
+            mismatches.add_row(latex, etree.tostring(element, encoding='unicode'))
+    return mismatches, unsupported
+
+
+def _convert_latex_many_xslt(latex_list):
+    if not latex_list:
+        return []
+    load_formula_dependencies()
+    if formula_profiler is None:
+        mathml = [latex2mathml.converter.convert(e) for e in latex_list]
+        tree = etree.fromstring('<batch>' + ''.join(mathml) + '</batch>')
+        root = get_mml2omml_transform()(tree).getroot()
+    else:
+        mathml = []
+        for latex in latex_list:
+            t = time.perf_counter()
+            mathml.append(latex2mathml.converter.convert(latex))
+            formula_profiler.add('latex2mathml', time.perf_counter() - t, [latex])
+        t = time.perf_counter()
+        tree = etree.fromstring('<batch>' + ''.join(mathml) + '</batch>')
+        formula_profiler.add('parse', time.perf_counter() - t, latex_list)
+        t = time.perf_counter()
+        root = get_mml2omml_transform()(tree).getroot()
+        formula_profiler.add('xslt', time.perf_counter() - t, latex_list)
+    elements = list(root)
+    for e in elements:
+        root.remove(e)
+    return elements
+
+
+def _convert_latex_many(latex_list):
+    if not use_formula_emitter:
+        return _convert_latex_many_xslt(latex_list)
+    elements = [None] * len(latex_list)
+    fallback = []
+    for i, latex in enumerate(latex_list):
+        t = time.perf_counter()
+        try:
+            elements[i] = latex_to_omml(latex)
+        except UnsupportedFormula:
+            fallback.append(i)
+        if formula_profiler is not None:
+            formula_profiler.add('emit', time.perf_counter() - t, [latex])
+    for i, element in zip(fallback, _convert_latex_many_xslt([latex_list[i] for i in fallback])):
+        elements[i] = element
+    return elements
+
+
+def _init_formula_worker():
+    get_mml2omml_transform()
+
+
+def _convert_latex_chunk(latex_list):
+    return [etree.tostring(e) for e in _convert_latex_many(latex_list)]
+
+
+def latex_to_word_parallel(latex_list, workers=None, chunk_size=16):
+    """
+    Конвертирует формулы в пуле процессов, каждый процесс компилирует свой XSLT.
+    Процессы возвращают сериализованный OMML, который разбирается в текущем процессе
+    """
+    chunks = [latex_list[i:i + chunk_size] for i in range(0, len(latex_list), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_formula_worker) as executor:
+        return [etree.fromstring(e) for chunk in executor.map(_convert_latex_chunk, chunks) for e in chunk]
+
+
+def latex_to_word_many(latex_list, workers=None, sections=None):
+    """
+    Конвертирует список формул за один проход XSLT, либо в пуле из workers процессов.
+    Формулы из кэшей не конвертируются, повторы конвертируются один раз.
+    sections - разделы отчёта, запросившие формулы, для профилировщика
+    """
+    load_formula_dependencies()
+    t = time.perf_counter()
+    elements = [None] * len(latex_list)
+    missing = OrderedDict()
+    for i, latex in enumerate(latex_list):
+        if latex in missing:
+            missing[latex].append(i)
+            continue
+        element = formula_cache.get(latex)
+        if element is None and formula_disk_cache is not None:
+            element = formula_disk_cache.get(latex)
+            if element is not None:
+                formula_cache.put(latex, element)
+        if element is None:
+            missing[latex] = [i]
+        else:
+            elements[i] = element
+    if formula_profiler is not None:
+        formula_profiler.add('cache', time.perf_counter() - t, latex_list, sections)
+        if sections is not None:
+            formula_profiler.sections = {latex: sections[indexes[0]] for latex, indexes in missing.items()}
+
+    if missing:
+        if workers is not None and workers > 1 and len(missing) > 1:
+            t = time.perf_counter()
+            converted = latex_to_word_parallel(list(missing.keys()), workers)
+            if formula_profiler is not None:
+                formula_profiler.add('pool', time.perf_counter() - t, list(missing.keys()))
+        else:
+            converted = _convert_latex_many(list(missing.keys()))
+        t = time.perf_counter()
+        for (latex, indexes), element in zip(missing.items(), converted):
+            if formula_disk_cache is not None:
+                formula_disk_cache.put(latex, element)
+            formula_cache.put(latex, element)
+            elements[indexes[0]] = element
+            for i in indexes[1:]:
+                elements[i] = copy.deepcopy(element)
+        if formula_profiler is not None:
+            formula_profiler.add('cache', time.perf_counter() - t, list(missing.keys()))
+            formula_profiler.sections = {}
+    return elements
+
+
+def latex_to_word(latex_input):
+    if formula_profiler is not None:
+        formula_profiler.request([latex_input])
+    return latex_to_word_many([latex_input])[0]
+
+
+class FormulaTemplate:
+    """
+    Формула с числовыми слотами $name, например 'k = \\frac{$A}{$B} = $C'.
+    Конвертируется в OMML один раз, на место слотов подставляются уникальные числа,
+    при render в копии заменяется только текст узлов m:t.
+    Значения слотов должны быть числами (как из fn), иначе результат будет отличаться от latex_to_word.
+    Слот не может стоять вплотную к точке или другому слоту, '$A $B' и '$A .5' допустимы
+    """
+    __slots__ = ['latex', 'slots', '_element', '_texts']
+
+    SLOT = re.compile(r'\$([A-Za-z_][A-Za-z0-9_]*)')
+    # a slot written next to '.' or another slot is one number with it, a real value would be split differently
+    TOUCHING = re.compile(r'\.\$|\$[A-Za-z_][A-Za-z0-9_]*[.$]')
+
+    def __init__(self, latex: str):
+        if FormulaTemplate.TOUCHING.search(latex):
+            raise ValueError('error, slot touches a number or another slot in formula ' + latex)
+        self.latex = latex
+        self.slots = []
+        for name in FormulaTemplate.SLOT.findall(latex):
+            if name not in self.slots:
+                self.slots.append(name)
+
+        sentinels = {}
+        n = 0
+        for name in self.slots:
+            # digits only, so XSLT merges the slot with neighbouring numbers exactly like a real value
+            while True:
+                n += 1
+                sentinel = '9' + str(n).rjust(6, '0') + '9'
+                if sentinel not in latex:
+                    break
+            sentinels[name] = sentinel
+
+        self._element = latex_to_word(FormulaTemplate.SLOT.sub(lambda m: sentinels[m.group(1)], latex))
+
+        # (index of m:t, [text parts alternating with slot names])
+        self._texts = []
+        found = []
+        pattern = re.compile('|'.join(sentinels.values())) if sentinels else None
+        for i, t in enumerate(self._element.iter(M_T)):
+            if pattern is None or t.text is None or not pattern.search(t.text):
+                continue
+            parts = []
+            start = 0
+            for m in pattern.finditer(t.text):
+                name = next(k for k, v in sentinels.items() if v == m.group(0))
+                parts += [t.text[start:m.start()], name]
+                found.append(name)
+                start = m.end()
+            parts.append(t.text[start:])
+            self._texts.append((i, parts))
+
+        if sorted(found) != sorted(FormulaTemplate.SLOT.findall(latex)):
+            raise ValueError('error, slots are not plain text of formula ' + latex)
+
+    def render(self, **values):
+        missing = [e for e in self.slots if e not in values]
+        if missing:
+            raise KeyError('error, no values for slots ' + ', '.join(missing))
+        t = time.perf_counter()
+        element = copy.deepcopy(self._element)
+        texts = list(element.iter(M_T))
+        for i, parts in self._texts:
+            # latex2mathml turns '-' into the minus sign
+            texts[i].text = ''.join(str(values[e]).replace('-', '\u2212') if j % 2 else e for j, e in enumerate(parts))
+        if formula_profiler is not None:
+            formula_profiler.request([self.latex])
+            formula_profiler.add('template', time.perf_counter() - t, [self.latex])
+        return element
+
+    def __str__(self):
+        return self.latex
+
+
+_formula_templates = {}
+
+
+def formula_template(latex):
+    template = _formula_templates.get(latex)
+    if template is None:
+        template = _formula_templates[latex] = FormulaTemplate(latex)
+    return template
+
+
+def add_formula_template(latex, p=None, style=None, **values):
+    return add_omml(formula_template(latex).render(**values), p, style)
+
+
+# deferred mode: formulas are queued as (placeholder, latex, section for the profiler) and converted by flush_formulas
+_deferred_formulas = None
+
+
+def set_deferred_formulas(enabled=True):
+    global _deferred_formulas
+    if enabled and _deferred_formulas is None:
+        _deferred_formulas = []
+    elif not enabled and _deferred_formulas is not None:
+        flush_formulas()
+        _deferred_formulas = None
+
+
+def formula_elements(latex_list):
+    """
+    OMML элементы формул. В отложенном режиме возвращает пустые m:oMath заглушки,
+    которые заменяются на формулы в flush_formulas
+    """
+    section = None
+    if formula_profiler is not None:
+        section = formula_profiler.request(latex_list)
+    if _deferred_formulas is None:
+        return latex_to_word_many(latex_list)
+    load_report_dependencies()
+    placeholders = []
+    for latex in latex_list:
+        placeholder = OxmlElement('m:oMath')
+        _deferred_formulas.append((placeholder, latex, section))
+        placeholders.append(placeholder)
+    return placeholders
+
+
+def flush_formulas(workers=None):
+    """
+    Конвертирует все отложенные формулы одним пакетом (или в пуле из workers процессов)
+    и вставляет их на место заглушек
+    """
+    if not _deferred_formulas:
+        return 0
+    queue = list(_deferred_formulas)
+    _deferred_formulas.clear()
+    sections = [e[2] for e in queue]
+    elements = latex_to_word_many([e[1] for e in queue], workers, sections)
+    t = time.perf_counter()
+    for (placeholder, _, _), element in zip(queue, elements):
+        placeholder.getparent().replace(placeholder, element)
+    if formula_profiler is not None:
+        formula_profiler.add('append', time.perf_counter() - t, [e[1] for e in queue], sections)
+    return len(queue)
+
+
+def save_document(path, workers=None):
+    flush_formulas(workers)
+    document.save(path)
+
+
+def add_omml(element, p=None, style=None):
+    t = time.perf_counter()
     if p is None:
         if style is None:
             p = dp(style=formula_style)
         else:
             p = dp(style=style)
-        p.add_run()._element.append(latex_to_word(latex))
-    else:
-        p.add_run()._element.append(latex_to_word(latex))
+    p.add_run()._element.append(element)
+    if formula_profiler is not None:
+        formula_profiler.add('append', time.perf_counter() - t)
     return p
 
 
+def add_formula(latex, p=None, style=None):
+    return add_omml(formula_elements([latex])[0], p, style)
+
+
 def add_formula_with_description(latex, description, style=None):
-    p = add_formula(latex, style=style)
+    elements = formula_elements([latex] + [e[0] for e in description])
+    p = add_omml(elements[0], style=style)
     fs = Pt(14)
     p.add_run('\nГде:\n').font.size = fs
     for i, e in enumerate(description):
-        add_formula(e[0], p, formula_style)
+        add_omml(elements[i + 1], p, formula_style)
         p.add_run(' - ' + e[1] + ('\n' if i + 1 < len(description) else '')).font.size = fs
     return p
 
@@ -321,6 +1151,40 @@ def fn(num, ln=2):
     return ('{:,.' + str(ln) + 'f}').format(num)
 
 
+# every chapter parameter read through InitialData.param with its default value,
+# the parameters accepted by ReportModel.set and swept by tornado
+CHAPTER_PARAMS = MappingProxyType({
+    'chapter_1.N_machine_work_percent': 0.75,
+    'chapter_2.stimulating_salary_percent': 1.0,
+    'chapter_3.help_materials_percent': 0.05,
+    'chapter_3.moving_save_percent': 0.12,
+    'chapter_3.move_save_const_percent': 0.3,
+    'chapter_3.inventory_percent': 0.03,
+    'chapter_3.fuel_percent': 0.55,
+    'chapter_3.fuel_tech_percent': 0.7,
+    'chapter_3.OS_amortisation_percent': 0.1,
+    'chapter_3.NMA_amortisation_percent': 0.1,
+    'chapter_3.OS_fix_percent': 0.06,
+    'chapter_3.extra_percent': 0.05,
+    'chapter_4.S_kom_percent': 0.04,
+    'chapter_4.S_kom_const_percent': 0.6,
+    'chapter_5.k_ob_sr_percent': 0.4,
+    'chapter_6.k_ob_RPB_percent': 0.3,
+    'chapter_6.ustavnoy_capital_percent': 0.8,
+    'chapter_6.doldosroch_zaemn_sredstva_percent': 0.6,
+    'chapter_6.kratkosroch_zaemn_sredstva_percent': 0.25,
+    'chapter_7.tax': 0.2,
+    'chapter_7.net_profit_percent': 0.6,
+    'chapter_7.price_fact_percent': 0.94,
+    'chapter_8.N_fact_percent': 0.95,
+    'chapter_8.kom_percent': 0.94,
+    'chapter_8.pr_dir_fact_percent': 0.93,
+    'chapter_2_1.A_percent': 0.25,
+    'chapter_2_1.B_percent': 0.5,
+    'chapter_2_1.C_percent': 0.25,
+})
+
+
 class InitialData:
     __slots__ = [
         'N_pl',
@@ -328,10 +1192,12 @@ class InitialData:
         'materials_A', 'accessories_A', 'operations_A',
         'materials_B', 'accessories_B', 'operations_B',
         'materials_C', 'accessories_C', 'operations_C',
+        'params',
     ]
 
     def __init__(self, N_pl=45_000):
         self.N_pl = N_pl
+        self.params = {}
         self.materials_B = self.materials = Table('name', 'cost', 'amount', 't_zap')
 
         self.materials.add_row('а', 60, 1, 30)
@@ -387,6 +1253,47 @@ class InitialData:
         self.operations_C.add_row(1_600_000, 1.0, 'г')
         self.operations_C.add_row(1_700_000, 0.5, 'д')
 
+    def clone(self, N_pl):
+        """
+        Исходные данные с другим объёмом выпуска, таблицы общие с исходными
+        """
+        clone = InitialData.__new__(InitialData)
+        for name in InitialData.__slots__:
+            setattr(clone, name, getattr(self, name))
+        clone.N_pl = N_pl
+        return clone
+
+    def param(self, name):
+        """
+        Параметр раздела (например 'chapter_3.fuel_percent'), если он не задан в params - значение по умолчанию из CHAPTER_PARAMS
+        """
+        return self.params.get(name, CHAPTER_PARAMS[name])
+
+    def changes(self):
+        """
+        Отличия от исходных данных по умолчанию (InitialData()) в виде изменений для ReportModel.set:
+        N_pl, ячейки таблиц ('materials.б.cost') и параметры глав
+        """
+        default = InitialData()
+        result = {}
+        if self.N_pl != default.N_pl:
+            result['N_pl'] = self.N_pl
+        seen = []
+        for name in InitialData.__slots__:
+            table = getattr(self, name)
+            # materials_B and materials are the same table
+            if not isinstance(table, Table) or any(e is table for e in seen):
+                continue
+            seen.append(table)
+            base = getattr(default, name)
+            for row in table.rows:
+                base_row = base.find('name', row['name'])
+                for header in table.headers:
+                    if header != 'name' and (base_row is None or row[header] != base_row[header]):
+                        result['{}.{}.{}'.format(name, row['name'], header)] = row[header]
+        result.update(self.params)
+        return result
+
 
 class Chapter_1:
     __slots__ = [
@@ -411,7 +1318,7 @@ class Chapter_1:
         self.H = 20
         self.gamma = 0.05
         self.F_ob_ef = (self.T_pl - self.B) * self.C * self.D * (1 - self.gamma)
-        self.N_machine_work_percent = 0.75
+        self.N_machine_work_percent = initial_data.param('chapter_1.N_machine_work_percent')
 
         self.machines = Table('name', 'cost', 'n rasch', 'n fact', 'b_fact')
 
@@ -464,7 +1371,7 @@ class Chapter_2:
     def __init__(self, initial_data: InitialData, chapter_1: Chapter_1, const=None):
         self.F_rab_ef = (chapter_1.T_pl - chapter_1.B - chapter_1.O - chapter_1.H) * chapter_1.D
 
-        total_time = initial_data.operations.calculate_sum(lambda x: x['time'])
+        total_time = initial_data.operations.calculate_sum('time')
 
         self.R_opr_raw = initial_data.N_pl * total_time / self.F_rab_ef
         self.R_opr = int(math.ceil(self.R_opr_raw))
@@ -492,7 +1399,7 @@ class Chapter_2:
         self.opr_salary = 50_000
         self.opr_extra = 5_000
 
-        self.stimulating_salary_percent = 1.0
+        self.stimulating_salary_percent = initial_data.param('chapter_2.stimulating_salary_percent')
 
         self.C_opr_mean = 12 * self.opr_salary / self.F_rab_ef
         self.p_mean = self.C_opr_mean * total_time / len(initial_data.operations.rows)
@@ -553,7 +1460,7 @@ class Chapter_3:
         pass
 
     def __init__(self, initial_data: InitialData, chapter_1: Chapter_1, chapter_2: Chapter_2, const=None):
-        self.S_mat_i_comp = initial_data.materials.calculate_sum(lambda x: x['cost'] * x['amount']) + initial_data.accessories.calculate_sum(lambda x: x['cost'] * x['amount'])
+        self.S_mat_i_comp = initial_data.materials.calculate_sum('cost*amount') + initial_data.accessories.calculate_sum('cost*amount')
 
         self.costs = Value('S proizv', display_name='Затраты')
         self.main_materials = Value('material', variable=initial_data.N_pl * self.S_mat_i_comp, display_name='Материальные затраты')
@@ -561,25 +1468,25 @@ class Chapter_3:
 
         self.main_materials.add_child(Value('material_main', 0, m_base, display_name='Основные материалы'))
 
-        self.help_materials_percent = 0.05
+        self.help_materials_percent = initial_data.param('chapter_3.help_materials_percent')
         self.main_materials.add_child(Value('helper', 0, round(m_base * self.help_materials_percent, 2), display_name='Вспомогательные материалы'))
 
-        self.moving_save_percent = 0.12
-        self.move_save_const_percent = 0.3
+        self.moving_save_percent = initial_data.param('chapter_3.moving_save_percent')
+        self.move_save_const_percent = initial_data.param('chapter_3.move_save_const_percent')
         ms = round(m_base * self.moving_save_percent, 2)
         msc = round(ms * self.move_save_const_percent, 2) if const is None or const['move save'] is None else const['move save'].const
         msv = round(ms - msc, 2) if const is None or const['move save'] is None else round((1 - self.move_save_const_percent) * ms, 2)
         self.main_materials.add_child(Value('move save', msc, msv, display_name='Транспортно-заготовительные расходы'))
 
-        self.inventory_percent = 0.03
+        self.inventory_percent = initial_data.param('chapter_3.inventory_percent')
         self.main_materials.add_child(
             Value('inventory', const=round(m_base * self.inventory_percent, 2), display_name='Инструменты, инвентарь')
             if const is None or const['inventory'] is None else const['inventory'])
 
-        self.fuel_percent = 0.55
+        self.fuel_percent = initial_data.param('chapter_3.fuel_percent')
         fuelt = round(m_base * self.fuel_percent, 2)
 
-        self.fuel_tech_percent = 0.7
+        self.fuel_tech_percent = initial_data.param('chapter_3.fuel_tech_percent')
         self.fuel_non_tech_percent = 1.0 - self.fuel_tech_percent
 
         fuel_energy_costs = self.main_materials.add_child(Value('fuel total', display_name='Топливо и энергия'))
@@ -592,11 +1499,11 @@ class Chapter_3:
         self.costs.add_child(chapter_2.FOT)
         self.costs.add_child(chapter_2.FOT_fee)
 
-        self.OS_amortisation_percent = 0.1
+        self.OS_amortisation_percent = initial_data.param('chapter_3.OS_amortisation_percent')
         self.OS_amortisation = round(self.OS_amortisation_percent * chapter_1.S_os_amortisable, 2)
 
         self.NMA = 3_000_000
-        self.NMA_amortisation_percent = 0.1
+        self.NMA_amortisation_percent = initial_data.param('chapter_3.NMA_amortisation_percent')
         self.NMA_amortisation = round(self.NMA_amortisation_percent * self.NMA, 2)
 
         aos = Value('amortisation OS', const=self.OS_amortisation, display_name='Амортизация ОС')
@@ -606,15 +1513,188 @@ class Chapter_3:
         a.add_child(anma)
         self.costs.add_child(a)
 
-        self.OS_fix_percent = 0.06
+        self.OS_fix_percent = initial_data.param('chapter_3.OS_fix_percent')
         self.OS_fix = round(self.OS_fix_percent * chapter_1.S_os_amortisable, 2)
 
-        self.extra_percent = 0.05
+        self.extra_percent = initial_data.param('chapter_3.extra_percent')
         self.costs.add_child(Value('extra', const=self.costs.const * self.extra_percent + self.OS_fix, variable=self.costs.variable * self.extra_percent, display_name='Прочие затраты'))
 
         self.S_pr_tek_pl = self.costs.total
 
 
+def _round_array(values, digits):
+    """
+    round(x, digits) для каждого элемента массива numpy с тем же результатом, что и встроенный round
+    """
+    import numpy
+    result = numpy.round(values, digits)
+    # np.round rounds the scaled value, the built-in round - the exact one, they only differ on exact ties
+    scaled = values * 10.0 ** digits
+    for i in numpy.flatnonzero(scaled - numpy.floor(scaled) == 0.5):
+        result.flat[i] = round(float(values.flat[i]), digits)
+    return result
+
+
+class CostParams:
+    """
+    Величины разделов 2-4, от которых зависят суммарные затраты S_sum для другого объёма выпуска.
+    Числа или массивы numpy одной длины - по значению на набор исходных данных
+    """
+    __slots__ = [
+        'N_pl',
+        'total_time', 'operations_count',
+        'F_rab_ef', 'p_mean', 'opr_extra', 'stimulating_salary_percent', 'opr_salary',
+
+        'S_mat_i_comp', 'help_materials_percent', 'moving_save_percent', 'move_save_const_percent',
+        'fuel_percent', 'fuel_tech_percent', 'extra_percent', 'costs_const',
+
+        'S_kom_percent', 'S_kom_const_percent', 'S_kom_const',
+    ]
+
+    def __init__(self, *, N_pl, total_time, operations_count, F_rab_ef, p_mean, opr_extra, stimulating_salary_percent, opr_salary,
+                 S_mat_i_comp, help_materials_percent, moving_save_percent, move_save_const_percent,
+                 fuel_percent, fuel_tech_percent, extra_percent, costs_const, S_kom_percent, S_kom_const_percent, S_kom_const):
+        self.N_pl = N_pl
+        self.total_time = total_time
+        self.operations_count = operations_count
+        self.F_rab_ef = F_rab_ef
+        self.p_mean = p_mean
+        self.opr_extra = opr_extra
+        self.stimulating_salary_percent = stimulating_salary_percent
+        self.opr_salary = opr_salary
+        self.S_mat_i_comp = S_mat_i_comp
+        self.help_materials_percent = help_materials_percent
+        self.moving_save_percent = moving_save_percent
+        self.move_save_const_percent = move_save_const_percent
+        self.fuel_percent = fuel_percent
+        self.fuel_tech_percent = fuel_tech_percent
+        self.extra_percent = extra_percent
+        self.costs_const = costs_const
+        self.S_kom_percent = S_kom_percent
+        self.S_kom_const_percent = S_kom_const_percent
+        self.S_kom_const = S_kom_const
+
+    @staticmethod
+    def from_chapters(initial_data: InitialData, chapter_2: Chapter_2, chapter_3: Chapter_3, chapter_4):
+        return CostParams(
+            N_pl=initial_data.N_pl,
+            total_time=initial_data.operations.calculate_sum('time'),
+            operations_count=len(initial_data.operations),
+            F_rab_ef=chapter_2.F_rab_ef,
+            p_mean=chapter_2.p_mean,
+            opr_extra=chapter_2.opr_extra,
+            stimulating_salary_percent=chapter_2.stimulating_salary_percent,
+            opr_salary=chapter_2.opr_salary,
+            S_mat_i_comp=chapter_3.S_mat_i_comp,
+            help_materials_percent=chapter_3.help_materials_percent,
+            moving_save_percent=chapter_3.moving_save_percent,
+            move_save_const_percent=chapter_3.move_save_const_percent,
+            fuel_percent=chapter_3.fuel_percent,
+            fuel_tech_percent=chapter_3.fuel_tech_percent,
+            extra_percent=chapter_3.extra_percent,
+            costs_const=chapter_3.costs.const,
+            S_kom_percent=chapter_4.S_kom_percent,
+            S_kom_const_percent=chapter_4.S_kom_const_percent,
+            S_kom_const=chapter_4.S_kom.const,
+        )
+
+    def costs(self, n):
+        """
+        Постоянные и переменные суммарные затраты (S_sum) для одного объёма выпуска
+        """
+        return self._costs(n, round, math.ceil)
+
+    def cost_arrays(self, n_values):
+        """
+        Затраты costs для массива объёмов выпуска за один проход
+
+        :return: (const, variable) - массивы numpy
+        """
+        import numpy
+        n = numpy.asarray(n_values)
+        const, variable = self._costs(n, _round_array, numpy.ceil)
+        return numpy.full(n.shape, const), variable
+
+    def _costs(self, n, round_, ceil):
+        """
+        S_sum для числа или массива n, round_ и ceil - округления для того же типа
+        """
+        # chapter 3: material costs
+        m_base = n * self.S_mat_i_comp
+        helper = round_(m_base * self.help_materials_percent, 2)
+        ms = round_(m_base * self.moving_save_percent, 2)
+        msv = round_((1 - self.move_save_const_percent) * ms, 2)
+        fuelt = round_(m_base * self.fuel_percent, 2)
+        ft = round_(fuelt * self.fuel_tech_percent, 2)
+        materials = m_base + helper + msv + ft
+
+        # chapter 2: only the variable part of FOT depends on n
+        R_opr = ceil(n * self.total_time / self.F_rab_ef)
+        FOT_opr = self.p_mean * n * self.operations_count
+        FOT_opr_extra = R_opr * (self.opr_extra * 12 + self.stimulating_salary_percent * self.opr_salary)
+        fot = FOT_opr + FOT_opr_extra
+        fot_fee = round_(fot * 0.34, 2)
+
+        costs = materials + fot + fot_fee
+        costs = costs + costs * self.extra_percent
+        # constant parts of the fake chain are taken from the base model, so their sums are the base ones
+        costs_const = self.costs_const
+
+        # chapter 4: commercial costs
+        S_b_proizv = (costs_const + costs) / n
+        s = round_(S_b_proizv * self.S_kom_percent, 0) * n
+        S_kom = s * (1 - self.S_kom_const_percent) * n / self.N_pl
+
+        return costs_const + self.S_kom_const, costs + S_kom
+
+
+class FakeModels:
+    """
+    Разделы 2-4 для другого объёма выпуска n,
+    постоянные затраты берутся из базовой модели
+    """
+    __slots__ = ['initial_data', 'chapter_1', 'chapter_2', 'chapter_3', 'base_chapter_4', '_cost_params']
+
+    def __init__(self, initial_data: InitialData, chapter_1: Chapter_1, chapter_2: Chapter_2, chapter_3: Chapter_3, chapter_4):
+        self.initial_data = initial_data
+        self.chapter_1 = chapter_1
+        self.chapter_2 = chapter_2
+        self.chapter_3 = chapter_3
+        self.base_chapter_4 = chapter_4
+        self._cost_params = None
+
+    def chapter_4(self, n):
+        fake_initial = self.initial_data.clone(n)
+        fake_chapter_2 = Chapter_2(fake_initial, self.chapter_1, const=self.chapter_2.FOT)
+        fake_chapter_3 = Chapter_3(fake_initial, self.chapter_1, fake_chapter_2, const=self.chapter_3.costs)
+        return Chapter_4(fake_initial, self.chapter_1, fake_chapter_2, fake_chapter_3, const=self.base_chapter_4.S_kom, base_initial_data=self.initial_data)
+
+    @property
+    def cost_params(self):
+        """
+        Величины базовой модели, от которых зависят затраты costs(n)
+        """
+        if self._cost_params is None:
+            self._cost_params = CostParams.from_chapters(self.initial_data, self.chapter_2, self.chapter_3, self.base_chapter_4)
+        return self._cost_params
+
+    def costs(self, n):
+        """
+        Постоянные и переменные суммарные затраты (S_sum) для одного объёма выпуска, без моделей и numpy.
+        Те же вычисления и округления, что в chapter_4(n), результат совпадает до бита
+        """
+        return self.cost_params.costs(n)
+
+    def cost_arrays(self, n_values):
+        """
+        Постоянные и переменные суммарные затраты (S_sum) для массива объёмов выпуска за один проход,
+        те же вычисления, что в costs
+
+        :return: (const, variable) - массивы numpy
+        """
+        return self.cost_params.cost_arrays(n_values)
+
+
 class Chapter_4:
     __slots__ = [
         'N_pl_values',
@@ -624,24 +1704,27 @@ class Chapter_4:
         'S_kom_const_percent',
         'S_kom',
         'S_sum',
+        'fake_models',
         'ct1'
     ]
 
     def calc_n(self, n):
-        fake_initial = InitialData(n)
-        fake_chapter_2 = Chapter_2(fake_initial, chapter_1, chapter_2.FOT)
-        fake_chapter_3 = Chapter_3(fake_initial, chapter_1, fake_chapter_2, const=chapter_3.costs)
-        fake_chapter_4 = Chapter_4(fake_initial, fake_chapter_3, self.S_kom)
-        return fake_chapter_4.S_sum.head()
+        return self.fake_models.chapter_4(n).S_sum.head()
+
+    @staticmethod
+    def calc_costs(costs, n):
+        const, variable = costs[n]
+        return Value('S_sum', const, variable, 'Суммарные затраты')
 
-    def __init__(self, initial_data_fm: InitialData, chapter_3: Chapter_3, const=None):
+    def __init__(self, initial_data_fm: InitialData, chapter_1: Chapter_1, chapter_2: Chapter_2, chapter_3: Chapter_3, const=None,
+                 base_initial_data: InitialData = None):
         self.N_pl_values = [450, 2700, 7200, 18900, 33750, 45000]
         self.S_b_proizv = chapter_3.S_pr_tek_pl / initial_data_fm.N_pl
-        self.S_kom_percent = 0.04
-        self.S_kom_const_percent = 0.6
+        self.S_kom_percent = initial_data_fm.param('chapter_4.S_kom_percent')
+        self.S_kom_const_percent = initial_data_fm.param('chapter_4.S_kom_const_percent')
         s = round(self.S_b_proizv * self.S_kom_percent, 0) * initial_data_fm.N_pl
         sc = round(s * self.S_kom_const_percent, 2) if const is None or const['S_kom'] is None else const['S_kom'].const
-        sv = round(s - sc, 2) if const is None or const['S_kom'] is None else s * (1 - self.S_kom_const_percent) * initial_data_fm.N_pl / initial_data.N_pl
+        sv = round(s - sc, 2) if const is None or const['S_kom'] is None else s * (1 - self.S_kom_const_percent) * initial_data_fm.N_pl / base_initial_data.N_pl
 
         self.S_sum = Value('S_sum', display_name='Суммарные затраты')
         self.S_sum.add_child(chapter_3.costs)
@@ -650,8 +1733,12 @@ class Chapter_4:
         self.S_b_poln = Value('S_b_poln', self.S_sum.const / initial_data_fm.N_pl, self.S_sum.variable / initial_data_fm.N_pl)
 
         if const is None:
-            self.ct1 = CalculateTable(self.N_pl_values, Chapter_4.calc_n, self)
+            self.fake_models = FakeModels(initial_data_fm, chapter_1, chapter_2, chapter_3, self)
+            # six volumes, the scalar path keeps numpy out of the numeric model
+            costs = {n: self.fake_models.costs(n) for n in self.N_pl_values}
+            self.ct1 = CalculateTable(self.N_pl_values, Chapter_4.calc_costs, costs)
         else:
+            self.fake_models = None
             self.ct1 = None
 
 
@@ -678,12 +1765,12 @@ class Chapter_5:
         mz = round(initial_data.materials.calculate_sum(lambda x: x['amount'] * x['cost'] * initial_data.N_pl / chapter_1.T_pl * x['t_zap']), 2)
         cz = round(initial_data.accessories.calculate_sum(lambda x: x['amount'] * x['cost'] * initial_data.N_pl / chapter_1.T_pl * x['t_zap']), 2)
         self.K_ob_sr_mk = round(mz + cz, 2)
-        self.k_ob_sr_percent = 0.4
+        self.k_ob_sr_percent = initial_data.param('chapter_5.k_ob_sr_percent')
         self.K_ob_sr_pr_zap = round((1 + self.k_ob_sr_percent) * self.K_ob_sr_mk, 2)
         self.k_nz = (chapter_3.S_mat_i_comp + chapter_4.S_b_proizv) / (chapter_4.S_b_proizv * 2)
         self.gamma_cycle = 50
 
-        self.T_cycle = round(initial_data.operations.calculate_sum(lambda x: x['time']) * self.gamma_cycle /
+        self.T_cycle = round(initial_data.operations.calculate_sum('time') * self.gamma_cycle /
                              (chapter_1.C * chapter_1.D) * chapter_1.T_pl / (chapter_1.T_pl - chapter_1.B), 3)
 
         self.K_ob_nez_pr = chapter_4.S_b_proizv * initial_data.N_pl / chapter_1.T_pl * self.k_nz * self.T_cycle
@@ -706,27 +1793,27 @@ class Chapter_6:
         'active_passive'
     ]
 
-    def __init__(self, chapter_1: Chapter_1, chapter_5: Chapter_5):
+    def __init__(self, initial_data: InitialData, chapter_1: Chapter_1, chapter_3: Chapter_3, chapter_5: Chapter_5):
         self.active_passive = ActivePassive()
 
         self.active_passive.NMA = chapter_3.NMA
         self.active_passive.OS = chapter_1.S_os
 
-        self.k_ob_RPB_percent = 0.3
+        self.k_ob_RPB_percent = initial_data.param('chapter_6.k_ob_RPB_percent')
         self.active_passive.K_ob_RBP = round(chapter_5.K_ob_extra * self.k_ob_RPB_percent, 2)
         self.active_passive.K_ob_sr_pr_zap = chapter_5.K_ob_sr_pr_zap
         self.active_passive.K_ob_ds = chapter_5.K_ob_sum - (chapter_5.K_ob_sr_pr_zap + self.active_passive.K_ob_RBP)
         self.active_passive.K_ob_extra = chapter_5.K_ob_extra - self.active_passive.K_ob_RBP
 
-        self.ustavnoy_capital_percent = 0.8
+        self.ustavnoy_capital_percent = initial_data.param('chapter_6.ustavnoy_capital_percent')
         self.active_passive.ustavnoy_kapital = round(self.active_passive.active * self.ustavnoy_capital_percent, 2)
 
         S_summ_passiv_left = self.active_passive.active - self.active_passive.ustavnoy_kapital
 
-        self.doldosroch_zaemn_sredstva_percent = 0.6
+        self.doldosroch_zaemn_sredstva_percent = initial_data.param('chapter_6.doldosroch_zaemn_sredstva_percent')
         self.active_passive.doldosroch_zaemn_sredstva = round(S_summ_passiv_left * self.doldosroch_zaemn_sredstva_percent, 2)
 
-        self.kratkosroch_zaemn_sredstva_percent = 0.25
+        self.kratkosroch_zaemn_sredstva_percent = initial_data.param('chapter_6.kratkosroch_zaemn_sredstva_percent')
         self.active_passive.kratkosroch_zaem_sredstva = round(S_summ_passiv_left * self.kratkosroch_zaemn_sredstva_percent, 2)
         self.active_passive.kratkosroch_prochee = round(S_summ_passiv_left - self.active_passive.doldosroch_zaemn_sredstva - self.active_passive.kratkosroch_zaem_sredstva, 2)
 
@@ -745,16 +1832,16 @@ class Chapter_7:
         'P_fact'
     ]
 
-    def __init__(self, chapter_4: Chapter_4, chapter_6: Chapter_6):
-        self.tax = 0.2
-        self.net_profit_percent = 0.6
+    def __init__(self, initial_data: InitialData, chapter_4: Chapter_4, chapter_6: Chapter_6):
+        self.tax = initial_data.param('chapter_7.tax')
+        self.net_profit_percent = initial_data.param('chapter_7.net_profit_percent')
         self.net_profit = round(chapter_6.active_passive.ustavnoy_kapital * self.net_profit_percent, 2)
         self.profit_before_tax = round(self.net_profit / (1 - self.tax), 2)
         self.k_nats = self.profit_before_tax / chapter_4.S_sum.total
         self.P_b_poln = round(chapter_4.S_b_poln.total * (1 + self.k_nats), 2)
         self.P_b_perem = round(chapter_4.S_b_poln.variable * (1 + (self.profit_before_tax + chapter_4.S_sum.const) / chapter_4.S_sum.variable), 2)
         self.P_proizv_plan = max(self.P_b_poln, self.P_b_perem)
-        self.price_fact_percent = 0.94
+        self.price_fact_percent = initial_data.param('chapter_7.price_fact_percent')
         self.P_fact = round(self.P_proizv_plan * self.price_fact_percent, 2)
 
 
@@ -778,7 +1865,7 @@ class Chapter_8:
     ]
 
     def __init__(self, initial_data: InitialData, chapter_3: Chapter_3, chapter_4: Chapter_4, chapter_5: Chapter_5, chapter_7: Chapter_7):
-        self.N_fact_percent = 0.95
+        self.N_fact_percent = initial_data.param('chapter_8.N_fact_percent')
         self.N_fact = int(self.N_fact_percent * initial_data.N_pl)
         self.N_ost = initial_data.N_pl - self.N_fact
 
@@ -793,7 +1880,7 @@ class Chapter_8:
         self.S_valovaya_plan = self.Q_plan - self.S_pr_got_pr_plan
         self.S_valovaya_fact = self.Q_fact - self.S_pr_got_pr_fact
 
-        self.kom_percent = 0.94
+        self.kom_percent = initial_data.param('chapter_8.kom_percent')
         self.S_kom_plan = chapter_4.S_kom.total
         self.S_kom_fact = self.kom_percent * chapter_4.S_kom.total
 
@@ -801,7 +1888,7 @@ class Chapter_8:
         self.P_pr_fact = self.S_valovaya_fact - self.S_kom_fact
 
         self.P_pr_do_nalogov_plan = chapter_7.profit_before_tax
-        self.pr_dir_fact_percent = 0.93
+        self.pr_dir_fact_percent = initial_data.param('chapter_8.pr_dir_fact_percent')
         self.S_prochie_dohidy_i_rashody_plan = self.P_pr_plan - self.P_pr_do_nalogov_plan
         self.S_prochie_dohidy_i_rashody_fact = round(self.S_prochie_dohidy_i_rashody_plan * self.pr_dir_fact_percent, 2)
         self.P_pr_do_nalogov_fact = self.P_pr_fact - self.S_prochie_dohidy_i_rashody_fact
@@ -822,7 +1909,7 @@ class Chapter_9:
         'valid_to_cope_kz_plan', 'valid_to_cope_kz_fact',
     ]
 
-    def __init__(self):
+    def __init__(self, chapter_1: Chapter_1, chapter_3: Chapter_3, chapter_5: Chapter_5, chapter_6: Chapter_6, chapter_8: Chapter_8):
         amortisation = chapter_3.costs['amortisation'].total
 
         self.K_den_sr_plan = chapter_6.active_passive.K_ob_ds + amortisation + chapter_8.P_chistaya_plan - (chapter_5.K_ob_nez_pr + chapter_8.K_ob_got_prod_plan)
@@ -913,24 +2000,21 @@ class Chapter_10:
     ]
 
     @staticmethod
-    def calc_n(n):
-        fake_initial = InitialData(n)
-        fake_chapter_2 = Chapter_2(fake_initial, chapter_1, chapter_2.FOT)
-        fake_chapter_3 = Chapter_3(fake_initial, chapter_1, fake_chapter_2, const=chapter_3.costs)
-        fake_chapter_4 = Chapter_4(fake_initial, fake_chapter_3, chapter_4.S_kom)
-        return fake_chapter_4.S_sum
+    def calc_n(chapter_4: Chapter_4, n):
+        return chapter_4.fake_models.chapter_4(n).S_sum
 
     @staticmethod
-    def bin_search():
+    def bisect(N_pl, profitable):
+        """
+        Бинарный поиск точки безубыточности на [0, N_pl], profitable(n) - выручка больше затрат
+        """
         N_kr_left = 0
-        N_kr_right = initial_data.N_pl
+        N_kr_right = N_pl
 
         while N_kr_right - N_kr_left > 1:
             N_kr_mean = round((N_kr_right + N_kr_left) / 2)
 
-            s = Chapter_10.calc_n(N_kr_mean)
-
-            if N_kr_mean * chapter_7.P_proizv_plan > s['S_sum'].total:
+            if profitable(N_kr_mean):
                 N_kr_right = N_kr_mean
             else:
                 N_kr_left = N_kr_mean
@@ -938,13 +2022,31 @@ class Chapter_10:
         return N_kr_left
 
     @staticmethod
-    def calc_k_pokr(n):
-        fake_initial = InitialData(n)
-        fake_chapter_2 = Chapter_2(fake_initial, chapter_1, const=chapter_2.FOT)
-        fake_chapter_3 = Chapter_3(fake_initial, chapter_1, fake_chapter_2, const=chapter_3.costs)
-        fake_chapter_4 = Chapter_4(fake_initial, fake_chapter_3, const=chapter_4.S_kom)
+    def bin_search(initial_data: InitialData, chapter_4: Chapter_4, chapter_7: Chapter_7):
+        return Chapter_10.bisect(initial_data.N_pl, lambda n: n * chapter_7.P_proizv_plan > Chapter_10.calc_n(chapter_4, n)['S_sum'].total)
 
-        k_pokr = (chapter_7.P_proizv_plan - fake_chapter_4.S_b_poln.variable) / chapter_7.P_proizv_plan
+    @staticmethod
+    def break_even(initial_data: InitialData, chapter_4: Chapter_4, chapter_7: Chapter_7):
+        """
+        Точка безубыточности тем же бинарным поиском, что и bin_search, но затраты для каждого n
+        считаются FakeModels.costs без построения моделей. Результат всегда совпадает с bin_search
+        """
+        fake_models = chapter_4.fake_models
+        P = chapter_7.P_proizv_plan
+
+        def profitable(n):
+            const, variable = fake_models.costs(n)
+            return n * P > const + variable
+
+        return Chapter_10.bisect(initial_data.N_pl, profitable)
+
+    @staticmethod
+    def calc_k_pokr(context, n):
+        chapter_4, chapter_7 = context
+        # S_b_poln.variable of the model for n is S_sum.variable / n
+        S_b_poln_variable = chapter_4.ct1.output_data[chapter_4.N_pl_values.index(n)].variable / n
+
+        k_pokr = (chapter_7.P_proizv_plan - S_b_poln_variable) / chapter_7.P_proizv_plan
 
         return k_pokr
 
@@ -994,9 +2096,9 @@ class Chapter_10:
         self.R_sobstv_capital_plan = chapter_8.P_chistaya_plan / self.S_sobstv_cap_year_mean_plan
         self.R_sobstv_capital_fact = chapter_8.P_chistaya_fact / self.S_sobstv_cap_year_mean_fact
 
-        self.N_kr = Chapter_10.bin_search()
+        self.N_kr = Chapter_10.break_even(initial_data, chapter_4, chapter_7)
         self.Q_kr = self.N_kr * chapter_7.P_proizv_plan
-        self.k_pokr = CalculateTable(chapter_4.N_pl_values, Chapter_10.calc_k_pokr)
+        self.k_pokr = CalculateTable(chapter_4.N_pl_values, Chapter_10.calc_k_pokr, (chapter_4, chapter_7))
 
         self.Q_fin_pr_plan = (chapter_8.Q_plan - self.Q_kr) / chapter_8.Q_plan
         self.Q_fin_pr_fact = (chapter_8.Q_fact - self.Q_kr) / chapter_8.Q_fact
@@ -1013,9 +2115,9 @@ class Chapter_2_1:
     ]
 
     def __init__(self, initial_data: InitialData):
-        self.A_percent = 0.25
-        self.B_percent = 0.5
-        self.C_percent = 0.25
+        self.A_percent = initial_data.param('chapter_2_1.A_percent')
+        self.B_percent = initial_data.param('chapter_2_1.B_percent')
+        self.C_percent = initial_data.param('chapter_2_1.C_percent')
 
         self.N_pl_A = round(initial_data.N_pl * self.A_percent)
         self.N_pl_C = round(initial_data.N_pl * self.C_percent)
@@ -1081,7 +2183,7 @@ class Chapter_2_2:
                 b_fact = 0
             self.machines.add_row(name, stock, machine, need_total, need_new, b_fact, machine_and_cost[1])
 
-        self.new_machines_cost = self.machines.calculate_sum(lambda x: x['need_new'] * x['cost'])
+        self.new_machines_cost = self.machines.calculate_sum('need_new*cost')
 
         self.main_resources = Table('n', 'name', '%', 'cost I', 'amortisation I', 'cost II begin', 'delta', 'cost II')
         S_os_delta = round(self.new_machines_cost / 0.4 * 0.5, 2)
@@ -1130,12 +2232,12 @@ class Chapter_2_3:
         'FOT', 'FOT_fee', 'insurance_fee', 'FOT_with_fee',
     ]
 
-    def __init__(self, chapter_2: Chapter_2, chapter_2_1: Chapter_2_1):
+    def __init__(self, initial_data: InitialData, chapter_2: Chapter_2, chapter_2_1: Chapter_2_1):
         self.F_rab_ef = (chapter_2_1.T_pl - chapter_2_1.B - chapter_2_1.O - chapter_2_1.H) * chapter_2_1.D
 
-        self.total_time_A = initial_data.operations_A.calculate_sum(lambda x: x['time'])
-        self.total_time_B = initial_data.operations_B.calculate_sum(lambda x: x['time'])
-        self.total_time_C = initial_data.operations_C.calculate_sum(lambda x: x['time'])
+        self.total_time_A = initial_data.operations_A.calculate_sum('time')
+        self.total_time_B = initial_data.operations_B.calculate_sum('time')
+        self.total_time_C = initial_data.operations_C.calculate_sum('time')
 
         self.total_time = chapter_2_1.N_pl_A * self.total_time_A + chapter_2_1.N_pl_B * self.total_time_B + chapter_2_1.N_pl_C * self.total_time_C
 
@@ -1196,15 +2298,16 @@ class Chapter_2_4:
         'S_sum'
     ]
 
-    def __init__(self, initial_data: InitialData, chapter_3: Chapter_3, chapter_4: Chapter_4, chapter_2_1: Chapter_2_1, chapter_2_3: Chapter_2_3, const=None):
+    def __init__(self, initial_data: InitialData, chapter_3: Chapter_3, chapter_4: Chapter_4,
+                 chapter_2_1: Chapter_2_1, chapter_2_2: Chapter_2_2, chapter_2_3: Chapter_2_3, const=None):
         self.S_materials_i_comp_B = chapter_3.S_mat_i_comp
 
-        A_m = initial_data.materials_A.calculate_sum(lambda x: x['amount'] * x['cost'])
-        A_a = initial_data.accessories_A.calculate_sum(lambda x: x['amount'] * x['cost'])
+        A_m = initial_data.materials_A.calculate_sum('amount*cost')
+        A_a = initial_data.accessories_A.calculate_sum('amount*cost')
         self.S_materials_i_comp_A = A_m + A_a
 
-        C_m = initial_data.materials_C.calculate_sum(lambda x: x['amount'] * x['cost'])
-        C_a = initial_data.accessories_C.calculate_sum(lambda x: x['amount'] * x['cost'])
+        C_m = initial_data.materials_C.calculate_sum('amount*cost')
+        C_a = initial_data.accessories_C.calculate_sum('amount*cost')
         self.S_materials_i_comp_C = C_m + C_a
 
         main_materials = chapter_2_1.N_pl_A * self.S_materials_i_comp_A + chapter_2_1.N_pl_B * self.S_materials_i_comp_B + chapter_2_1.N_pl_C * self.S_materials_i_comp_C
@@ -1331,9 +2434,9 @@ class Chapter_2_5:
         self.indirect.add_row('8', 'Затраты на ремонт оборудования', WorkAndOther(chapter_2_4.costs['OS fix'].total))
         self.indirect.add_row('9', 'Прочие расходы', WorkAndOther(other=chapter_2_4.costs['pure extra'].total))
 
-        self.machine_time_A = initial_data.operations_A.filter_table(lambda x: len(x['name']) == 1).calculate_sum(lambda x: x['time'])
-        self.machine_time_B = initial_data.operations_B.filter_table(lambda x: len(x['name']) == 1).calculate_sum(lambda x: x['time'])
-        self.machine_time_C = initial_data.operations_C.filter_table(lambda x: len(x['name']) == 1).calculate_sum(lambda x: x['time'])
+        self.machine_time_A = initial_data.operations_A.filter_table(lambda x: len(x['name']) == 1).calculate_sum('time')
+        self.machine_time_B = initial_data.operations_B.filter_table(lambda x: len(x['name']) == 1).calculate_sum('time')
+        self.machine_time_C = initial_data.operations_C.filter_table(lambda x: len(x['name']) == 1).calculate_sum('time')
 
         self.total_machine_time = chapter_2_1.N_pl_A * self.machine_time_A + chapter_2_1.N_pl_B * self.machine_time_B + chapter_2_1.N_pl_C * self.machine_time_C
 
@@ -1386,7 +2489,8 @@ class Chapter_2_6:
         'K_ob_sum',
     ]
 
-    def __init__(self, chapter_5: Chapter_5, chapter_2_1: Chapter_2_1, chapter_2_5: Chapter_2_5):
+    def __init__(self, initial_data: InitialData, chapter_5: Chapter_5, chapter_6: Chapter_6,
+                 chapter_2_1: Chapter_2_1, chapter_2_4: Chapter_2_4, chapter_2_5: Chapter_2_5):
         mz = 0
         for i, n in [
             (initial_data.materials_A, chapter_2_1.N_pl_A),
@@ -1414,9 +2518,9 @@ class Chapter_2_6:
 
         ml = self.gamma_cycle / (chapter_2_1.C * chapter_2_1.D) * chapter_2_1.T_pl / (chapter_2_1.T_pl - chapter_2_1.B)
 
-        self.T_cycle_A = round(initial_data.operations_A.calculate_sum(lambda x: x['time']) * ml, 3)
-        self.T_cycle_B = round(initial_data.operations_B.calculate_sum(lambda x: x['time']) * ml, 3)
-        self.T_cycle_C = round(initial_data.operations_C.calculate_sum(lambda x: x['time']) * ml, 3)
+        self.T_cycle_A = round(initial_data.operations_A.calculate_sum('time') * ml, 3)
+        self.T_cycle_B = round(initial_data.operations_B.calculate_sum('time') * ml, 3)
+        self.T_cycle_C = round(initial_data.operations_C.calculate_sum('time') * ml, 3)
 
         self.K_ob_nez_pr_A = chapter_2_5.S_A_proizv * chapter_2_1.N_pl_A / chapter_2_1.T_pl * self.k_nz_A * self.T_cycle_A
         self.K_ob_nez_pr_B = chapter_2_5.S_B_proizv * chapter_2_1.N_pl_B / chapter_2_1.T_pl * self.k_nz_B * self.T_cycle_B
@@ -1452,7 +2556,7 @@ class Chapter_2_7:
         'active_passive'
     ]
 
-    def __init__(self, chapter_1: Chapter_1, chapter_3: Chapter_3, chapter_4: Chapter_4,
+    def __init__(self, initial_data: InitialData, chapter_1: Chapter_1, chapter_3: Chapter_3, chapter_4: Chapter_4,
                  chapter_7: Chapter_7, chapter_8: Chapter_8, chapter_9: Chapter_9, chapter_2_2: Chapter_2_2, chapter_2_6: Chapter_2_6):
         self.TS_real_ost = round(chapter_4.S_b_poln.total + (chapter_7.P_fact - chapter_4.S_b_poln.total) * 0.7, 2)
         self.P_real_ost = chapter_8.N_ost * self.TS_real_ost
@@ -1561,7 +2665,7 @@ class Chapter_2_8:
     ]
 
     @staticmethod
-    def calc_costs(mic, helper, move_save, inventory, fuel_tech, fuel_non_tech, FOT, FOT_fee, amortisation, OS_fix, extra):
+    def calc_costs(mic, helper, move_save, move_save_const_percent, inventory, fuel_tech, fuel_non_tech, FOT, FOT_fee, amortisation, OS_fix, extra):
         costs = Value('S proizv', display_name='Затраты')
         main_materials = Value('material', display_name='Материальные затраты')
 
@@ -1569,7 +2673,7 @@ class Chapter_2_8:
         main_materials.add_child(Value('helper', 0, helper, display_name='Вспомогательные материалы'))
 
         ms = move_save
-        msc = ms * chapter_3.move_save_const_percent
+        msc = ms * move_save_const_percent
         msv = (ms - msc)
         main_materials.add_child(Value('move save', msc, msv, display_name='Транспортно-заготовительные расходы'))
 
@@ -1593,11 +2697,12 @@ class Chapter_2_8:
         return costs
 
     @staticmethod
-    def calc_for_product(N, S_materials_i_comp, direct, indirect, costs, w, o):
+    def calc_for_product(chapter_3: Chapter_3, chapter_2_3: Chapter_2_3, N, S_materials_i_comp, direct, indirect, costs, w, o):
         A = Chapter_2_8.calc_costs(
             S_materials_i_comp * N,
             costs['helper'].total * (0.6 * w + 0.4 * o),
             costs['move save'].total * o,
+            chapter_3.move_save_const_percent,
             costs['inventory'].total * (0.8 * w + 0.2 * o),
             costs['fuel tech'].total * w,
             costs['fuel non tech'].total * o,
@@ -1609,7 +2714,8 @@ class Chapter_2_8:
         )
         return A
 
-    def __init__(self):
+    def __init__(self, initial_data: InitialData, chapter_3: Chapter_3, chapter_4: Chapter_4, chapter_7: Chapter_7, chapter_10: Chapter_10,
+                 chapter_2_1: Chapter_2_1, chapter_2_3: Chapter_2_3, chapter_2_4: Chapter_2_4, chapter_2_5: Chapter_2_5):
         pa = self.parametric_data = Table('name', 'A', 'B', 'C', 'importance A', 'importance C', 'power')
         pa.add_row('X1', 20, 20, 20, 0.1, 0.2, 0)
         pa.add_row('X2', 15, 12, 10, 0.5, 0.4, 1)
@@ -1640,11 +2746,11 @@ class Chapter_2_8:
         tmt = chapter_2_5.S_sv_s_rab_ob_A + chapter_2_5.S_sv_s_rab_ob_B + chapter_2_5.S_sv_s_rab_ob_C
         teb = chapter_2_5.S_ne_sv_s_rab_ob_A + chapter_2_5.S_ne_sv_s_rab_ob_B + chapter_2_5.S_ne_sv_s_rab_ob_C
 
-        self.costs_A = Chapter_2_8.calc_for_product(chapter_2_1.N_pl_A, chapter_2_4.S_materials_i_comp_A, chapter_2_5.direct_A,
+        self.costs_A = Chapter_2_8.calc_for_product(chapter_3, chapter_2_3, chapter_2_1.N_pl_A, chapter_2_4.S_materials_i_comp_A, chapter_2_5.direct_A,
                                                     chapter_2_5.indirect, chapter_2_4.costs, chapter_2_5.S_sv_s_rab_ob_A / tmt, chapter_2_5.S_ne_sv_s_rab_ob_A / teb)
-        self.costs_B = Chapter_2_8.calc_for_product(chapter_2_1.N_pl_B, chapter_2_4.S_materials_i_comp_B, chapter_2_5.direct_B,
+        self.costs_B = Chapter_2_8.calc_for_product(chapter_3, chapter_2_3, chapter_2_1.N_pl_B, chapter_2_4.S_materials_i_comp_B, chapter_2_5.direct_B,
                                                     chapter_2_5.indirect, chapter_2_4.costs, chapter_2_5.S_sv_s_rab_ob_B / tmt, chapter_2_5.S_ne_sv_s_rab_ob_B / teb)
-        self.costs_C = Chapter_2_8.calc_for_product(chapter_2_1.N_pl_C, chapter_2_4.S_materials_i_comp_C, chapter_2_5.direct_C,
+        self.costs_C = Chapter_2_8.calc_for_product(chapter_3, chapter_2_3, chapter_2_1.N_pl_C, chapter_2_4.S_materials_i_comp_C, chapter_2_5.direct_C,
                                                     chapter_2_5.indirect, chapter_2_4.costs, chapter_2_5.S_sv_s_rab_ob_C / tmt, chapter_2_5.S_ne_sv_s_rab_ob_C / teb)
 
         s_kom_A = chapter_2_4.S_kom.total * chapter_2_1.A_percent / (max(1, chapter_2_1.N_pl_A))
@@ -1703,7 +2809,8 @@ class Chapter_2_9:
         'P_chistaya_plan'
     ]
 
-    def __init__(self):
+    def __init__(self, initial_data: InitialData, chapter_7: Chapter_7, chapter_8: Chapter_8,
+                 chapter_2_1: Chapter_2_1, chapter_2_4: Chapter_2_4, chapter_2_6: Chapter_2_6, chapter_2_8: Chapter_2_8):
         self.Q_plan_A = chapter_2_8.TS_A_plan * chapter_2_1.N_pl_A
         self.Q_plan_B = chapter_2_8.TS_B_plan * chapter_2_1.N_pl_B
         self.Q_plan_C = chapter_2_8.TS_C_plan * chapter_2_1.N_pl_C
@@ -1741,7 +2848,7 @@ class Chapter_2_10:
         'valid_to_cope_kz_plan',
     ]
 
-    def __init__(self):
+    def __init__(self, chapter_2_2: Chapter_2_2, chapter_2_4: Chapter_2_4, chapter_2_6: Chapter_2_6, chapter_2_7: Chapter_2_7, chapter_2_9: Chapter_2_9):
         amortisation = chapter_2_4.costs['amortisation'].total
 
         self.K_den_sr_plan = chapter_2_7.active_passive['begin II'].active.K_ob_ds + amortisation + chapter_2_9.P_chistaya_plan - (chapter_2_6.K_ob_nez_pr + chapter_2_9.K_ob_got_prod_plan)
@@ -1803,7 +2910,8 @@ class Chapter_2_11:
         'N_kr_C', 'Q_kr_C', 'k_pokr_C', 'Q_fin_pr_C', 'proizv_richag_C',
     ]
 
-    def __init__(self):
+    def __init__(self, initial_data: InitialData, chapter_2_2: Chapter_2_2, chapter_2_3: Chapter_2_3, chapter_2_4: Chapter_2_4,
+                 chapter_2_7: Chapter_2_7, chapter_2_8: Chapter_2_8, chapter_2_9: Chapter_2_9, chapter_2_10: Chapter_2_10):
         self.k_sob_ob_sr_plan = chapter_2_10.active_passive_plan.r2 - chapter_2_10.active_passive_plan.r5
 
         self.k_obespech_sob_sr_plan = self.k_sob_ob_sr_plan / chapter_2_10.active_passive_plan.r2
@@ -1849,29 +2957,517 @@ class Chapter_2_11:
         self.proizv_richag_C = (chapter_2_9.Q_plan_C - chapter_2_8.S_C_sum.variable) / chapter_2_9.P_pr_plan_C
 
 
-initial_data = InitialData()
-chapter_1 = Chapter_1(initial_data)
-chapter_2 = Chapter_2(initial_data, chapter_1)
-chapter_3 = Chapter_3(initial_data, chapter_1, chapter_2)
-chapter_4 = Chapter_4(initial_data, chapter_3)
-chapter_5 = Chapter_5(initial_data, chapter_1, chapter_3, chapter_4)
-chapter_6 = Chapter_6(chapter_1, chapter_5)
-chapter_7 = Chapter_7(chapter_4, chapter_6)
-chapter_8 = Chapter_8(initial_data, chapter_3, chapter_4, chapter_5, chapter_7)
-chapter_9 = Chapter_9()
-chapter_10 = Chapter_10(initial_data, chapter_1, chapter_2, chapter_3, chapter_4, chapter_6, chapter_7, chapter_8, chapter_9)
-
-chapter_2_1 = Chapter_2_1(initial_data)
-chapter_2_2 = Chapter_2_2(initial_data, chapter_1, chapter_2_1, chapter_3)
-chapter_2_3 = Chapter_2_3(chapter_2, chapter_2_1)
-chapter_2_4 = Chapter_2_4(initial_data, chapter_3, chapter_4, chapter_2_1, chapter_2_3)
-chapter_2_5 = Chapter_2_5(initial_data, chapter_3, chapter_2_1, chapter_2_2, chapter_2_3, chapter_2_4)
-chapter_2_6 = Chapter_2_6(chapter_5, chapter_2_1, chapter_2_5)
-chapter_2_7 = Chapter_2_7(chapter_1, chapter_3, chapter_4, chapter_7, chapter_8, chapter_9, chapter_2_2, chapter_2_6)
-chapter_2_8 = Chapter_2_8()
-chapter_2_9 = Chapter_2_9()
-chapter_2_10 = Chapter_2_10()
-chapter_2_11 = Chapter_2_11()
+class ReportModel:
+    """
+    Граф разделов расчёта для одних исходных данных.
+    Раздел считается при первом обращении (model.chapter_7 или model.get('chapter_7')) вместе с нужными ему разделами
+    и запоминается, остальные разделы не считаются.
+    Модели не зависят друг от друга и от глобальных переменных, их можно строить сколько угодно
+    """
+    __slots__ = ['initial_data', '_values']
+
+    # node: (class, input nodes, InitialData fields read by the node), in calculation order
+    NODES = {
+        'chapter_1': (Chapter_1, ['initial_data'], ['N_pl', 'operations']),
+        'chapter_2': (Chapter_2, ['initial_data', 'chapter_1'], ['N_pl', 'operations']),
+        'chapter_3': (Chapter_3, ['initial_data', 'chapter_1', 'chapter_2'], ['N_pl', 'materials', 'accessories']),
+        'chapter_4': (Chapter_4, ['initial_data', 'chapter_1', 'chapter_2', 'chapter_3'], ['N_pl']),
+        'chapter_5': (Chapter_5, ['initial_data', 'chapter_1', 'chapter_3', 'chapter_4'], ['N_pl', 'materials', 'accessories', 'operations']),
+        'chapter_6': (Chapter_6, ['initial_data', 'chapter_1', 'chapter_3', 'chapter_5'], []),
+        'chapter_7': (Chapter_7, ['initial_data', 'chapter_4', 'chapter_6'], []),
+        'chapter_8': (Chapter_8, ['initial_data', 'chapter_3', 'chapter_4', 'chapter_5', 'chapter_7'], ['N_pl']),
+        'chapter_9': (Chapter_9, ['chapter_1', 'chapter_3', 'chapter_5', 'chapter_6', 'chapter_8'], []),
+        'chapter_10': (Chapter_10, ['initial_data', 'chapter_1', 'chapter_2', 'chapter_3', 'chapter_4', 'chapter_6', 'chapter_7', 'chapter_8', 'chapter_9'], ['N_pl']),
+
+        'chapter_2_1': (Chapter_2_1, ['initial_data'], ['N_pl']),
+        'chapter_2_2': (Chapter_2_2, ['initial_data', 'chapter_1', 'chapter_2_1', 'chapter_3'], ['operations_A', 'operations_B', 'operations_C']),
+        'chapter_2_3': (Chapter_2_3, ['initial_data', 'chapter_2', 'chapter_2_1'], ['operations_A', 'operations_B', 'operations_C']),
+        'chapter_2_4': (Chapter_2_4, ['initial_data', 'chapter_3', 'chapter_4', 'chapter_2_1', 'chapter_2_2', 'chapter_2_3'], ['materials_A', 'materials_C', 'accessories_A', 'accessories_C']),
+        'chapter_2_5': (Chapter_2_5, ['initial_data', 'chapter_3', 'chapter_2_1', 'chapter_2_2', 'chapter_2_3', 'chapter_2_4'], ['operations_A', 'operations_B', 'operations_C']),
+        'chapter_2_6': (Chapter_2_6, ['initial_data', 'chapter_5', 'chapter_6', 'chapter_2_1', 'chapter_2_4', 'chapter_2_5'], ['materials_A', 'materials_B', 'materials_C', 'accessories_A', 'accessories_B', 'accessories_C', 'operations_A', 'operations_B', 'operations_C']),
+        'chapter_2_7': (Chapter_2_7, ['initial_data', 'chapter_1', 'chapter_3', 'chapter_4', 'chapter_7', 'chapter_8', 'chapter_9', 'chapter_2_2', 'chapter_2_6'], ['operations_B']),
+        'chapter_2_8': (Chapter_2_8, ['initial_data', 'chapter_3', 'chapter_4', 'chapter_7', 'chapter_10', 'chapter_2_1', 'chapter_2_3', 'chapter_2_4', 'chapter_2_5'], ['N_pl']),
+        'chapter_2_9': (Chapter_2_9, ['initial_data', 'chapter_7', 'chapter_8', 'chapter_2_1', 'chapter_2_4', 'chapter_2_6', 'chapter_2_8'], ['N_pl']),
+        'chapter_2_10': (Chapter_2_10, ['chapter_2_2', 'chapter_2_4', 'chapter_2_6', 'chapter_2_7', 'chapter_2_9'], []),
+        'chapter_2_11': (Chapter_2_11, ['initial_data', 'chapter_2_2', 'chapter_2_3', 'chapter_2_4', 'chapter_2_7', 'chapter_2_8', 'chapter_2_9', 'chapter_2_10'], ['N_pl', 'materials', 'accessories', 'operations', 'materials_A', 'accessories_A', 'operations_A', 'operations_B', 'materials_C', 'accessories_C', 'operations_C']),
+    }
+
+    def __init__(self, initial_data: InitialData = None):
+        self.initial_data = InitialData() if initial_data is None else initial_data
+        self._values = {'initial_data': self.initial_data}
+
+    def get(self, name):
+        value = self._values.get(name)
+        if value is None:
+            if name not in ReportModel.NODES:
+                raise KeyError('error, unknown model node ' + str(name))
+            node_class, inputs, _ = ReportModel.NODES[name]
+            value = self._values[name] = node_class(*[self.get(e) for e in inputs])
+        return value
+
+    def __getattr__(self, name):
+        if name in ReportModel.NODES:
+            return self.get(name)
+        raise AttributeError('{!r} object has no attribute {!r}'.format(type(self).__name__, name))
+
+    def set(self, name, value):
+        """
+        Изменяет одно исходное значение и сбрасывает только зависящие от него разделы, они пересчитаются при обращении.
+        name - поле InitialData ('N_pl'), ячейка таблицы исходных данных ('materials.б.cost')
+        или параметр раздела ('chapter_3.fuel_percent').
+        Возвращает сброшенные разделы
+        """
+        parts = name.split('.')
+        dirty_fields = set()
+        dirty_nodes = set()
+        if len(parts) == 1 and parts[0] in InitialData.__slots__ and parts[0] != 'params':
+            setattr(self.initial_data, parts[0], value)
+            dirty_fields.add(parts[0])
+        elif len(parts) == 2 and parts[0] in ReportModel.NODES:
+            # computed attributes of a chapter are not inputs, only what the chapter reads through param()
+            if name not in CHAPTER_PARAMS:
+                print('error, model parameter not found', name)
+                return []
+            self.initial_data.params[name] = value
+            dirty_nodes.add(parts[0])
+        elif len(parts) == 3 and parts[0] in InitialData.__slots__ and isinstance(getattr(self.initial_data, parts[0]), Table):
+            table = getattr(self.initial_data, parts[0])
+            row = table.find('name', parts[1])
+            if row is None or parts[2] not in table.headers_map:
+                print('error, table cell not found', name)
+                return []
+            row[parts[2]] = value
+            # materials_B and materials are the same table
+            dirty_fields.update(e for e in InitialData.__slots__ if getattr(self.initial_data, e) is table)
+        else:
+            print('error, unknown model input', name)
+            return []
+
+        invalidated = []
+        for node, (_, inputs, fields) in ReportModel.NODES.items():
+            if node in dirty_nodes or dirty_fields.intersection(fields) or dirty_nodes.intersection(inputs):
+                dirty_nodes.add(node)
+                if self._values.pop(node, None) is not None:
+                    invalidated.append(node)
+        return invalidated
+
+    @property
+    def computed(self):
+        return [e for e in ReportModel.NODES.keys() if e in self._values]
+
+    def compute_all(self):
+        for name in ReportModel.NODES.keys():
+            self.get(name)
+        return self
+
+
+_default_model = None
+
+
+def default_model():
+    global _default_model
+    if _default_model is None:
+        _default_model = ReportModel()
+    return _default_model
+
+
+def bind_model(model: ReportModel):
+    """
+    Делает разделы модели глобальными переменными модуля, их используют функции gen_*
+    """
+    globals()['initial_data'] = model.initial_data
+    for name in ReportModel.NODES.keys():
+        globals()[name] = model.get(name)
+    return model
+
+
+# key metrics of a scenario: column, node, attribute
+SCENARIO_METRICS = [
+    ('P_fact', 'chapter_7', 'P_fact'),
+    ('P_chistaya_fact', 'chapter_8', 'P_chistaya_fact'),
+    ('N_kr', 'chapter_10', 'N_kr'),
+    ('R_sell', 'chapter_10', 'R_sell_plan'),
+    ('k_tek_likvid', 'chapter_10', 'k_tek_likvid_plan'),
+    ('TS_A_plan', 'chapter_2_8', 'TS_A_plan'),
+    ('TS_B_plan', 'chapter_2_8', 'TS_B_plan'),
+    ('TS_C_plan', 'chapter_2_8', 'TS_C_plan'),
+    ('N_kr_A', 'chapter_2_11', 'N_kr_A'),
+    ('N_kr_B', 'chapter_2_11', 'N_kr_B'),
+    ('N_kr_C', 'chapter_2_11', 'N_kr_C'),
+    ('R_sell_II', 'chapter_2_11', 'R_sell_plan'),
+    ('k_tek_likvid_II', 'chapter_2_11', 'k_tek_likvid_plan'),
+]
+
+
+def run_scenario(overrides):
+    """
+    Полная модель (разделы I и II) с изменёнными исходными данными, возвращает значения SCENARIO_METRICS
+    """
+    model = ReportModel()
+    for name, value in overrides.items():
+        model.set(name, value)
+    return [getattr(model.get(node), attribute) for _, node, attribute in SCENARIO_METRICS]
+
+
+def _try_scenario(overrides):
+    # a scenario the model cannot compute (zero share of a product and the like) must not abort the whole sweep
+    try:
+        return run_scenario(overrides), None
+    except ArithmeticError as e:
+        return [math.nan] * len(SCENARIO_METRICS), '{}: {}'.format(type(e).__name__, e)
+
+
+def run_scenarios(scenarios, workers=None, chunk_size=8):
+    """
+    Считает сценарии в пуле из workers процессов, workers=1 - в текущем процессе.
+    Сценарий - словарь изменений для ReportModel.set, например {'N_pl': 40_000, 'chapter_7.price_fact_percent': 0.9}.
+    Если модель сценария не считается, его показатели - nan, а ошибка записывается в название сценария
+
+    :return: таблица ключевых показателей, строка на сценарий
+    """
+    if workers == 1:
+        results = [_try_scenario(e) for e in scenarios]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_try_scenario, scenarios, chunksize=chunk_size))
+
+    table = Table('Сценарий', *[e[0] for e in SCENARIO_METRICS])
+    for overrides, (values, error) in zip(scenarios, results):
+        name = ', '.join('{}={}'.format(k, v) for k, v in overrides.items()) or 'базовый'
+        if error is not None:
+            print('error, scenario {} failed: {}'.format(name, error))
+            name += ' (ошибка: {})'.format(error)
+        table.add_row(name, *values)
+    return table
+
+
+def optimize_product_mix(initial_data: InitialData = None, step=0.05, min_k_tek_likvid=2.0, max_new_machines_cost=None, top=10):
+    """
+    Перебор долей изделий A, B, C (раздел II) с шагом step, критерий - чистая прибыль раздела II.
+    Ограничения: коэффициент текущей ликвидности не ниже min_k_tek_likvid,
+    стоимость нового оборудования не выше max_new_machines_cost (None - без ограничения).
+    Раздел I считается один раз, для каждого набора долей пересчитываются только разделы II
+
+    :return: таблица top лучших допустимых наборов, лучший - первая строка
+    """
+    initial_data = InitialData() if initial_data is None else initial_data
+    # own copy of the parameters, the shares are changed in it
+    data = initial_data.clone(initial_data.N_pl)
+    data.params = dict(initial_data.params)
+    model = ReportModel(data)
+
+    parts = round(1 / step)
+    results = []
+    for a in range(1, parts):
+        for c in range(1, parts - a):
+            model.set('chapter_2_1.A_percent', a / parts)
+            model.set('chapter_2_1.B_percent', (parts - a - c) / parts)
+            model.set('chapter_2_1.C_percent', c / parts)
+            try:
+                profit = model.chapter_2_9.P_chistaya_plan
+                k_tek_likvid = model.chapter_2_11.k_tek_likvid_plan
+                new_machines_cost = model.chapter_2_2.new_machines_cost
+            except ZeroDivisionError:
+                continue
+            if k_tek_likvid < min_k_tek_likvid:
+                continue
+            if max_new_machines_cost is not None and new_machines_cost > max_new_machines_cost:
+                continue
+            results.append((profit, a / parts, (parts - a - c) / parts, c / parts, new_machines_cost, k_tek_likvid))
+
+    results.sort(key=lambda e: -e[0])
+    table = Table('A', 'B', 'C', 'Чистая прибыль', 'Новое оборудование', 'k_тек.ликв.')
+    for profit, a, b, c, new_machines_cost, k_tek_likvid in results[:top]:
+        table.add_row(a, b, c, profit, new_machines_cost, k_tek_likvid)
+    return table
+
+
+# shares of products A, B and C in section II, they sum to 1
+PRODUCT_SHARES = ('chapter_2_1.A_percent', 'chapter_2_1.B_percent', 'chapter_2_1.C_percent')
+
+
+def tornado(delta=0.05, outputs=('P_chistaya_fact', 'N_kr', 'TS_A_plan', 'TS_B_plan', 'TS_C_plan'), base=None, workers=None):
+    """
+    Эластичность показателей outputs (столбцы SCENARIO_METRICS) по каждому параметру глав:
+    (y(+delta) - y(-delta)) / (2 * delta * y), параметр изменяется на +-delta от своего значения.
+    Доли изделий A, B, C в сумме дают 1, поэтому при изменении одной доли две другие меняются пропорционально своим значениям.
+    Все сценарии считаются одним вызовом run_scenarios, base - изменения, общие для всех сценариев
+
+    :return: таблица, строки по убыванию модуля эластичности первого показателя
+    """
+    base = {} if base is None else base
+    # parameters are read from the initial data, no chapter is computed
+    model = ReportModel()
+    for name, value in base.items():
+        model.set(name, value)
+    initial_data = model.initial_data
+
+    def changed(name, value):
+        if name not in PRODUCT_SHARES:
+            return {name: value}
+        rest = 1 - initial_data.param(name)
+        result = {name: value}
+        for e in PRODUCT_SHARES:
+            if e != name:
+                result[e] = (1 - value) * (initial_data.param(e) / rest if rest > 0 else 0.5)
+        return result
+
+    names = sorted(CHAPTER_PARAMS.keys())
+    values = [initial_data.param(e) for e in names]
+    scenarios = [dict(base)]
+    for name, value in zip(names, values):
+        scenarios.append(dict(base, **changed(name, value * (1 - delta))))
+        scenarios.append(dict(base, **changed(name, value * (1 + delta))))
+    results = run_scenarios(scenarios, workers)
+
+    columns = [results.headers_map[e] for e in outputs]
+    y = results.rows[0]
+    rows = []
+    for i, (name, value) in enumerate(zip(names, values)):
+        low = results.rows[1 + 2 * i]
+        high = results.rows[2 + 2 * i]
+        rows.append([name, value] + [(high[c] - low[c]) / (2 * delta * y[c]) if y[c] != 0 else 0 for c in columns])
+    rows.sort(key=lambda e: -abs(e[2]))
+
+    table = Table('Параметр', 'Значение', *['E ' + e for e in outputs])
+    for row in rows:
+        table.add_row(*row)
+    return table
+
+
+# chapters whose parameters batch_section_1 takes as arrays
+BATCH_CHAPTERS = ('chapter_3', 'chapter_4', 'chapter_5', 'chapter_6', 'chapter_7', 'chapter_8')
+
+
+def batch_section_1(model: ReportModel, values):
+    """
+    Раздел I (главы 3-10) сразу для многих наборов исходных данных, без создания объектов глав на каждый набор.
+    values - массивы numpy одной длины по именам из ReportModel.set: стоимости материалов и комплектующих
+    ('materials.б.cost', 'accessories.а.cost') и параметры глав 3-8 ('chapter_3.fuel_percent'),
+    остальное берётся из model. Вычисления повторяют главы, результат для каждого набора совпадает с ReportModel.
+    Для других имён бросает ValueError
+
+    :return: словарь массивов: P_chistaya_plan, P_chistaya_fact, N_kr, k_tek_likvid_*, k_abs_likvid_*
+    """
+    import numpy
+    initial_data = model.initial_data
+    chapter_1 = model.chapter_1
+    chapter_2 = model.chapter_2
+    N = initial_data.N_pl
+    values = {k: numpy.asarray(v) for k, v in values.items()}
+    size = len(next(iter(values.values())))
+
+    # an ignored input would look like a result without sensitivity, so it is an error
+    for name in values.keys():
+        parts = name.split('.')
+        if not (len(parts) == 3 and parts[0] in ('materials', 'accessories') and parts[2] == 'cost' and
+                getattr(initial_data, parts[0]).find('name', parts[1]) is not None or
+                name in CHAPTER_PARAMS and parts[0] in BATCH_CHAPTERS):
+            raise ValueError('error, batch model does not support input ' + name)
+
+    def param(node, name):
+        return values.get(node + '.' + name, getattr(model.get(node), name))
+
+    def rows(table):
+        return [(values.get('{}.{}.cost'.format(table, e['name']), e['cost']), e['amount'], e['t_zap'])
+                for e in getattr(initial_data, table).rows]
+
+    materials = rows('materials')
+    accessories = rows('accessories')
+
+    # chapter 3
+    S_mat_i_comp = 0
+    for cost, amount, _ in materials:
+        S_mat_i_comp = S_mat_i_comp + cost * amount
+    s = 0
+    for cost, amount, _ in accessories:
+        s = s + cost * amount
+    S_mat_i_comp = S_mat_i_comp + s
+
+    m_base = N * S_mat_i_comp
+    helper = _round_array(m_base * param('chapter_3', 'help_materials_percent'), 2)
+    ms = _round_array(m_base * param('chapter_3', 'moving_save_percent'), 2)
+    msc = _round_array(ms * param('chapter_3', 'move_save_const_percent'), 2)
+    msv = _round_array(ms - msc, 2)
+    inventory = _round_array(m_base * param('chapter_3', 'inventory_percent'), 2)
+    fuelt = _round_array(m_base * param('chapter_3', 'fuel_percent'), 2)
+    ft = _round_array(fuelt * param('chapter_3', 'fuel_tech_percent'), 2)
+    materials_const = msc + inventory + (fuelt - ft)
+    materials_variable = m_base + helper + msv + ft
+
+    OS_amortisation = _round_array(param('chapter_3', 'OS_amortisation_percent') * chapter_1.S_os_amortisable, 2)
+    NMA_amortisation = _round_array(param('chapter_3', 'NMA_amortisation_percent') * model.chapter_3.NMA, 2)
+    amortisation = OS_amortisation + NMA_amortisation
+    OS_fix = _round_array(param('chapter_3', 'OS_fix_percent') * chapter_1.S_os_amortisable, 2)
+    extra_percent = param('chapter_3', 'extra_percent')
+
+    costs_const = materials_const + chapter_2.FOT.const + chapter_2.FOT_fee.const + amortisation
+    costs_variable = materials_variable + chapter_2.FOT.variable + chapter_2.FOT_fee.variable
+    costs_const = costs_const + (costs_const * extra_percent + OS_fix)
+    costs_variable = costs_variable + costs_variable * extra_percent
+    S_pr_tek_pl = costs_const + costs_variable
+
+    # chapter 4
+    S_b_proizv = S_pr_tek_pl / N
+    S_kom_percent = param('chapter_4', 'S_kom_percent')
+    S_kom_const_percent = param('chapter_4', 'S_kom_const_percent')
+    s = _round_array(S_b_proizv * S_kom_percent, 0) * N
+    S_kom_const = _round_array(s * S_kom_const_percent, 2)
+    S_kom_variable = _round_array(s - S_kom_const, 2)
+    S_kom = S_kom_const + S_kom_variable
+    S_sum_const = costs_const + S_kom_const
+    S_sum_variable = costs_variable + S_kom_variable
+
+    # chapter 5
+    mz = 0
+    for cost, amount, t_zap in materials:
+        mz = mz + amount * cost * N / chapter_1.T_pl * t_zap
+    cz = 0
+    for cost, amount, t_zap in accessories:
+        cz = cz + amount * cost * N / chapter_1.T_pl * t_zap
+    K_ob_sr_mk = _round_array(_round_array(mz, 2) + _round_array(cz, 2), 2)
+    K_ob_sr_pr_zap = _round_array((1 + param('chapter_5', 'k_ob_sr_percent')) * K_ob_sr_mk, 2)
+    k_nz = (S_mat_i_comp + S_b_proizv) / (S_b_proizv * 2)
+    K_ob_nez_pr = S_b_proizv * N / chapter_1.T_pl * k_nz * model.chapter_5.T_cycle
+    K_ob_got_prod = _round_array(S_b_proizv * N / chapter_1.T_pl * model.chapter_5.t_real, 2)
+    a = _round_array(K_ob_sr_pr_zap + K_ob_nez_pr + K_ob_got_prod, 2)
+    K_ob_sum = _round_array(a / model.chapter_5.gamma_ob, 2)
+    K_ob_extra = _round_array(K_ob_sum - a, 2)
+
+    # chapter 6
+    K_ob_RBP = _round_array(K_ob_extra * param('chapter_6', 'k_ob_RPB_percent'), 2)
+    K_ob_ds = K_ob_sum - (K_ob_sr_pr_zap + K_ob_RBP)
+    K_ob_extra = K_ob_extra - K_ob_RBP
+    active = model.chapter_3.NMA + chapter_1.S_os + (K_ob_sr_pr_zap + K_ob_RBP + K_ob_extra + K_ob_ds)
+    ustavnoy_kapital = _round_array(active * param('chapter_6', 'ustavnoy_capital_percent'), 2)
+    left = active - ustavnoy_kapital
+    doldosroch = _round_array(left * param('chapter_6', 'doldosroch_zaemn_sredstva_percent'), 2)
+    kratkosroch = _round_array(left * param('chapter_6', 'kratkosroch_zaemn_sredstva_percent'), 2)
+    kratkosroch_prochee = _round_array(left - doldosroch - kratkosroch, 2)
+
+    # chapter 7
+    tax = param('chapter_7', 'tax')
+    net_profit = _round_array(ustavnoy_kapital * param('chapter_7', 'net_profit_percent'), 2)
+    profit_before_tax = _round_array(net_profit / (1 - tax), 2)
+    k_nats = profit_before_tax / (S_sum_const + S_sum_variable)
+    P_b_poln = _round_array((S_sum_const / N + S_sum_variable / N) * (1 + k_nats), 2)
+    P_b_perem = _round_array(S_sum_variable / N * (1 + (profit_before_tax + S_sum_const) / S_sum_variable), 2)
+    P_proizv_plan = numpy.maximum(P_b_poln, P_b_perem)
+    P_fact = _round_array(P_proizv_plan * param('chapter_7', 'price_fact_percent'), 2)
+
+    # chapter 8
+    N_fact = numpy.trunc(param('chapter_8', 'N_fact_percent') * N).astype(numpy.int64)
+    N_ost = N - N_fact
+    K_ob_got_prod_fact = K_ob_got_prod + _round_array(S_b_proizv * N_ost, 2)
+    P_pr_plan = P_proizv_plan * N - (S_pr_tek_pl - K_ob_nez_pr - K_ob_got_prod) - S_kom
+    P_pr_fact = P_fact * N_fact - (S_pr_tek_pl - K_ob_nez_pr - K_ob_got_prod_fact) - param('chapter_8', 'kom_percent') * S_kom
+    S_prochie_fact = _round_array((P_pr_plan - profit_before_tax) * param('chapter_8', 'pr_dir_fact_percent'), 2)
+    P_pr_do_nalogov_fact = P_pr_fact - S_prochie_fact
+    P_chistaya_fact = P_pr_do_nalogov_fact - _round_array(P_pr_do_nalogov_fact * tax, 2)
+
+    # chapter 9
+    def end_of_year(K_den_sr):
+        K_den_sr_konez = numpy.where(K_den_sr - 500_000 > kratkosroch, K_den_sr - kratkosroch,
+                                     numpy.where(K_den_sr > 500_000, 500_000, K_den_sr))
+        zaem = numpy.where(K_den_sr - 500_000 > kratkosroch, 0,
+                           numpy.where(K_den_sr > 500_000, kratkosroch - (K_den_sr - 500_000), kratkosroch))
+        return K_den_sr_konez, zaem
+
+    K_den_sr_konez_plan, _ = end_of_year(K_ob_ds + amortisation + net_profit - (K_ob_nez_pr + K_ob_got_prod))
+    K_den_sr_konez_fact, zaem_fact = end_of_year(K_ob_ds + amortisation + P_chistaya_fact - (K_ob_nez_pr + K_ob_got_prod_fact))
+    r2_plan = K_ob_sr_pr_zap + K_ob_nez_pr + K_ob_got_prod + K_ob_RBP + K_ob_extra + K_den_sr_konez_plan
+    r2_fact = K_ob_sr_pr_zap + K_ob_nez_pr + K_ob_got_prod_fact + K_ob_RBP + K_ob_extra + K_den_sr_konez_fact
+    r5_plan = 0 + kratkosroch_prochee
+    r5_fact = zaem_fact + kratkosroch_prochee
+
+    # chapter 10: break-even by bisection for all sets at once, costs of volume n as in FakeModels.cost_arrays
+    cost_params = CostParams(
+        N_pl=N,
+        total_time=initial_data.operations.calculate_sum('time'),
+        operations_count=len(initial_data.operations),
+        F_rab_ef=chapter_2.F_rab_ef,
+        p_mean=chapter_2.p_mean,
+        opr_extra=chapter_2.opr_extra,
+        stimulating_salary_percent=chapter_2.stimulating_salary_percent,
+        opr_salary=chapter_2.opr_salary,
+        S_mat_i_comp=S_mat_i_comp,
+        help_materials_percent=param('chapter_3', 'help_materials_percent'),
+        moving_save_percent=param('chapter_3', 'moving_save_percent'),
+        move_save_const_percent=param('chapter_3', 'move_save_const_percent'),
+        fuel_percent=param('chapter_3', 'fuel_percent'),
+        fuel_tech_percent=param('chapter_3', 'fuel_tech_percent'),
+        extra_percent=param('chapter_3', 'extra_percent'),
+        costs_const=costs_const,
+        S_kom_percent=S_kom_percent,
+        S_kom_const_percent=S_kom_const_percent,
+        S_kom_const=S_kom_const,
+    )
+
+    N_kr_left = numpy.zeros(size, dtype=numpy.int64)
+    N_kr_right = numpy.full(size, N, dtype=numpy.int64)
+    while True:
+        searching = N_kr_right - N_kr_left > 1
+        if not searching.any():
+            break
+        N_kr_mean = numpy.round((N_kr_right + N_kr_left) / 2).astype(numpy.int64)
+        const, variable = cost_params.cost_arrays(N_kr_mean)
+        profitable = N_kr_mean * P_proizv_plan > const + variable
+        N_kr_right = numpy.where(searching & profitable, N_kr_mean, N_kr_right)
+        N_kr_left = numpy.where(searching & ~profitable, N_kr_mean, N_kr_left)
+
+    results = {
+        'P_chistaya_plan': net_profit,
+        'P_chistaya_fact': P_chistaya_fact,
+        'N_kr': N_kr_left,
+        'k_tek_likvid_plan': r2_plan / r5_plan,
+        'k_tek_likvid_fact': r2_fact / r5_fact,
+        'k_abs_likvid_plan': K_den_sr_konez_plan / r5_plan,
+        'k_abs_likvid_fact': K_den_sr_konez_fact / r5_fact,
+    }
+    # values that do not depend on the varied inputs are scalars
+    return {k: numpy.broadcast_to(v, (size,)) for k, v in results.items()}
+
+
+def monte_carlo(draws=100_000, seed=0, spread=0.1, inputs=None, initial_data: InitialData = None):
+    """
+    Анализ чувствительности методом Монте-Карло по разделу I.
+    inputs - словарь имя: (минимум, максимум) для равномерного распределения, по умолчанию стоимости материалов
+    и комплектующих, доли продаж и цены (глава 7, 8), проценты главы 3 в пределах +-spread от базовых значений.
+    Один и тот же seed даёт одни и те же результаты
+
+    :return: таблица распределений показателей
+    """
+    import numpy
+    model = ReportModel(initial_data)
+    if inputs is None:
+        inputs = {}
+        for table in ['materials', 'accessories']:
+            for row in getattr(model.initial_data, table).rows:
+                inputs['{}.{}.cost'.format(table, row['name'])] = row['cost']
+        inputs['chapter_7.price_fact_percent'] = model.chapter_7.price_fact_percent
+        inputs['chapter_8.N_fact_percent'] = model.chapter_8.N_fact_percent
+        for name in ['help_materials_percent', 'moving_save_percent', 'inventory_percent', 'fuel_percent', 'extra_percent']:
+            inputs['chapter_3.' + name] = getattr(model.chapter_3, name)
+        inputs = {k: (v * (1 - spread), min(v * (1 + spread), 1.0) if k.endswith('_percent') else v * (1 + spread))
+                  for k, v in inputs.items()}
+
+    generator = numpy.random.default_rng(seed)
+    values = {k: generator.uniform(low, high, draws) for k, (low, high) in inputs.items()}
+    results = batch_section_1(model, values)
+
+    table = Table('Показатель', 'Среднее', 'Ст. откл.', 'P5', 'P50', 'P95', 'Мин', 'Макс')
+    for name, e in results.items():
+        p5, p50, p95 = numpy.percentile(e, [5, 50, 95])
+        table.add_row(name, float(e.mean()), float(e.std()), float(p5), float(p50), float(p95), float(e.min()), float(e.max()))
+    return table
+
+
+def __getattr__(name):
+    # mc.chapter_7 and the like are computed in the default model on first access
+    if name == 'initial_data' or name in ReportModel.NODES:
+        value = globals()[name] = default_model().get(name)
+        return value
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
 
 
 def gen_first_list():
@@ -1925,7 +3521,7 @@ def gen_initial_data():
         table_last_row = table.add_row()
         table_last_row.cells[0].paragraphs[0].add_run('Итого, руб.').bold = True
         table_last_row.cells[1].merge(table_last_row.cells[2])
-        table_last_row.cells[1].paragraphs[0].add_run(str(data.calculate_sum(lambda x: x['cost'] * x['amount']))).bold = True
+        table_last_row.cells[1].paragraphs[0].add_run(str(data.calculate_sum('cost*amount'))).bold = True
         table_last_row.cells[1].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
     dp('Исходные данные 623', title_text)
@@ -1951,7 +3547,7 @@ def gen_initial_data():
     table_4_lr = table_4.add_row()
     table_4_lr.cells[0].merge(table_4_lr.cells[2])
     table_4_lr.cells[0].paragraphs[0].add_run('Итого, час.').bold = True
-    table_4_lr.cells[3].paragraphs[0].add_run(str(initial_data.operations.calculate_sum(lambda x: x['time']))).bold = True
+    table_4_lr.cells[3].paragraphs[0].add_run(str(initial_data.operations.calculate_sum('time'))).bold = True
     table_4_lr.cells[3].paragraphs[0].alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
 
     document.add_page_break()
@@ -2696,10 +4292,10 @@ def gen_1_10():
 
         dp('Коэффициент абсолютной ликвидности:')
         add_formula('k_{абс.ликв.} = \\frac{Абсолютно\\ ликвидныке\\ активы}{Краткосрочные\\ обязательства}')
-        add_formula('k_{абс.ликв.\\ план} = \\frac{' +
-                    f'{fn(chapter_9.active_passive_plan.K_ob_ds)} }}{{ {fn(chapter_9.active_passive_plan.r5)} }} = {fn(chapter_10.k_abs_likvid_plan)}', style=formula_style_12)
-        add_formula('k_{абс.ликв.\\ факт} = \\frac{' +
-                    f'{fn(chapter_9.active_passive_fact.K_ob_ds)} }}{{ {fn(chapter_9.active_passive_fact.r5)} }} = {fn(chapter_10.k_abs_likvid_fact)}', style=formula_style_12)
+        add_formula_template('k_{абс.ликв.\\ план} = \\frac{ $A }{ $B } = $C', style=formula_style_12,
+                             A=fn(chapter_9.active_passive_plan.K_ob_ds), B=fn(chapter_9.active_passive_plan.r5), C=fn(chapter_10.k_abs_likvid_plan))
+        add_formula_template('k_{абс.ликв.\\ факт} = \\frac{ $A }{ $B } = $C', style=formula_style_12,
+                             A=fn(chapter_9.active_passive_fact.K_ob_ds), B=fn(chapter_9.active_passive_fact.r5), C=fn(chapter_10.k_abs_likvid_fact))
 
         dp()
         dp('Коэффициент текущей ликвидности (или коэффициент покрытия баланса):')
@@ -2945,8 +4541,8 @@ def gen_2_2():
         [None, 'B'] + [str(e['cost']) for e in initial_data.materials_C.rows],
         ['Норма расхода, ед.измер./шт.', 'A'] + [str(e['amount']) for e in initial_data.materials_A.rows],
         [None, 'B'] + [str(e['amount']) for e in initial_data.materials_C.rows],
-        ['Итого материалов на изделие А, руб./шт.', None, None, None, fn(initial_data.materials_A.calculate_sum(lambda x: x['amount'] * x['cost'])), None],
-        ['Итого материалов на изделие B, руб./шт.', None, None, None, fn(initial_data.materials_C.calculate_sum(lambda x: x['amount'] * x['cost'])), None]
+        ['Итого материалов на изделие А, руб./шт.', None, None, None, fn(initial_data.materials_A.calculate_sum('amount*cost')), None],
+        ['Итого материалов на изделие B, руб./шт.', None, None, None, fn(initial_data.materials_C.calculate_sum('amount*cost')), None]
     ], [Cm(7), Cm(2), Cm(2), Cm(2), Cm(2), Cm(2)], True, style=table_style)
     table.cell(0, 0).merge(table.cell(0, 1))
     table.cell(1, 0).merge(table.cell(2, 0))
@@ -2964,8 +4560,8 @@ def gen_2_2():
         [None, 'B'] + [str(e['cost']) for e in initial_data.accessories_C.rows],
         ['Норма расхода, ед.измер./шт.', 'A'] + [str(e['amount']) for e in initial_data.accessories_A.rows],
         [None, 'B'] + [str(e['amount']) for e in initial_data.accessories_C.rows],
-        ['Итого комплектующих на изделие А, руб./шт.', None, None, fn(initial_data.accessories_A.calculate_sum(lambda x: x['amount'] * x['cost'])), None],
-        ['Итого комплектующих на изделие B, руб./шт.', None, None, fn(initial_data.accessories_C.calculate_sum(lambda x: x['amount'] * x['cost'])), None]
+        ['Итого комплектующих на изделие А, руб./шт.', None, None, fn(initial_data.accessories_A.calculate_sum('amount*cost')), None],
+        ['Итого комплектующих на изделие B, руб./шт.', None, None, fn(initial_data.accessories_C.calculate_sum('amount*cost')), None]
     ], [Cm(7), Cm(2), Cm(2), Cm(2), Cm(2)], True)
     table.cell(0, 0).merge(table.cell(0, 1))
     table.cell(1, 0).merge(table.cell(2, 0))
@@ -3019,9 +4615,9 @@ def gen_2_2():
           fn(e['cost'] * e['need_new'], 0),
           fn(e['b_fact'])] for e in chapter_2_2.machines.rows] +
         [['Итого', None,
-          fn(chapter_2_2.machines.calculate_sum(lambda x: x['need_fact']), 0),
-          fn(chapter_2_2.machines.calculate_sum(lambda x: x['stock']), 0),
-          fn(chapter_2_2.machines.calculate_sum(lambda x: x['need_new']), 0),
+          fn(chapter_2_2.machines.calculate_sum('need_fact'), 0),
+          fn(chapter_2_2.machines.calculate_sum('stock'), 0),
+          fn(chapter_2_2.machines.calculate_sum('need_new'), 0),
           fn(chapter_2_2.new_machines_cost, 0), None]],
         [Cm(3.2), Cm(1.75), Cm(1.75), Cm(2.75), Cm(2.75), Cm(2.75), Cm(2)], style=table_style_12)
     add_formula('n_{об.i_{расч.}}', table.cell(1, 1).paragraphs[0])
@@ -3048,7 +4644,7 @@ def gen_2_2():
           fn(chapter_2_2.main_resources.filter_table(lambda x: len(x['n']) > 0).calculate_sum(lambda x: x['cost I']), 0),
           fn(chapter_2_2.main_resources.filter_table(lambda x: len(x['n']) > 0).calculate_sum(lambda x: x['amortisation I']), 0),
           fn(chapter_2_2.main_resources.filter_table(lambda x: len(x['n']) > 0).calculate_sum(lambda x: x['cost II begin']), 0),
-          fn(chapter_2_2.main_resources.filter_table(lambda x: len(x['n']) > 0).calculate_sum(lambda x: x['delta']), 0),
+          fn(chapter_2_2.main_resources.filter_table(lambda x: len(x['n']) > 0).calculate_sum('delta'), 0),
           fn(chapter_2_2.main_resources.filter_table(lambda x: len(x['n']) > 0).calculate_sum(lambda x: x['cost II']), 0),
           '100']],
         [Cm(0.7), Cm(3.25), Cm(2.25), Cm(2), Cm(2.25), Cm(2), Cm(3.25), Cm(1.0)],
@@ -3512,7 +5108,7 @@ def gen_2_7():
     add_table(
         [['Оборудование', 'Излишек, шт.', 'Остаточная стоимость, руб./шт.']] +
         [[e['name'], fn(e['extra'], 0), fn(e['cost'])] for e in chapter_2_7.to_sell.rows] +
-        [['Итого', fn(chapter_2_7.to_sell.calculate_sum(lambda x: x['extra']), 0), fn(chapter_2_7.S_sell_OS)]]
+        [['Итого', fn(chapter_2_7.to_sell.calculate_sum('extra'), 0), fn(chapter_2_7.S_sell_OS)]]
     )
     dp('Примем, что избыточное оборудование будет реализовано за ' + f'{fn(chapter_2_7.S_sell_OS)} руб.')
     dp()
@@ -3754,8 +5350,8 @@ def gen_2_11():
 
         dp('Коэффициент абсолютной ликвидности:')
         add_formula('k_{абс.ликв.} = \\frac{Абсолютно\\ ликвидныке\\ активы}{Краткосрочные\\ обязательства}')
-        add_formula('k_{абс.ликв.\\ план} = \\frac{' +
-                    f'{fn(chapter_2_10.active_passive_plan.K_ob_ds)} }}{{ {fn(chapter_2_10.active_passive_plan.r5)} }} = {fn(chapter_2_11.k_abs_likvid_plan)}', style=formula_style_12)
+        add_formula_template('k_{абс.ликв.\\ план} = \\frac{ $A }{ $B } = $C', style=formula_style_12,
+                             A=fn(chapter_2_10.active_passive_plan.K_ob_ds), B=fn(chapter_2_10.active_passive_plan.r5), C=fn(chapter_2_11.k_abs_likvid_plan))
 
         dp()
         dp('Коэффициент текущей ликвидности (или коэффициент покрытия баланса):')
@@ -4036,11 +5632,43 @@ def gen_2_11():
     document.add_page_break()
 
 
+def gen_tornado(delta=0.05, top=15):
+    load_report_dependencies()
+    table = tornado(delta, base=initial_data.changes())
+
+    dp('Анализ чувствительности', title_text)
+    dp(f'Эластичность показателей по параметрам расчёта при изменении параметра на ±{fn(delta * 100, 0)}%, '
+       f'{top} наиболее значимых параметров.')
+    data = [['Параметр', 'Значение'] + [e[2:] for e in table.headers[2:]]]
+    for row in table.rows[:top]:
+        data.append([row[0], fn(row[1], 3)] + [fn(e, 3) for e in row.data[2:]])
+    add_table(data, first_bold=True)
+
+    dp('График, эластичность чистой прибыли', table_name_text)
+    rows = table.rows[:top][::-1]
+    plt.figure(figsize=(8, 6))
+    plt.barh([e[0] for e in rows], [e[2] for e in rows])
+    plt.axvline(0, color='#444444')
+    plt.xlabel('Эластичность ' + table.headers[2][2:])
+    plt.grid(True, axis='x')
+    plt.tight_layout()
+
+    memfile = BytesIO()
+    plt.savefig(memfile)
+    plt.close()
+
+    picP = document.add_paragraph()
+    picP.paragraph_format.alignment = WD_PARAGRAPH_ALIGNMENT.CENTER
+    picP.add_run().add_picture(memfile, width=Cm(17))
+    picP.add_run().add_break(WD_BREAK.PAGE)
+
+
 def gen_final():
     dp('Заключение', title_text)
 
 
-def main():
+def main(model: ReportModel = None, sensitivity=False):
+    bind_model(default_model() if model is None else model)
     init_styles()
     p = gen_first_list()
     gen_introduction()
@@ -4068,6 +5696,8 @@ def main():
     gen_2_9()
     gen_2_10()
     gen_2_11()
+    if sensitivity:
+        gen_tornado()
     gen_final()
 
     return p
@@ -4135,10 +5765,15 @@ def add_table_of_content(paragraph):
 
 
 if __name__ == '__main__':
-    import time
-
     t = time.time()
-    paragraph = main()
+    formula_cache_dir = os.environ.get('MC_FORMULA_CACHE_DIR', '.formula_cache')
+    if formula_cache_dir:
+        enable_formula_disk_cache(formula_cache_dir)
+    formula_workers = int(os.environ.get('MC_FORMULA_WORKERS', '0'))
+    set_deferred_formulas(os.environ.get('MC_DEFERRED_FORMULAS', '1') != '0')
+    if os.environ.get('MC_PROFILE_FORMULAS') == '1':
+        enable_formula_profiler()
+    paragraph = main(sensitivity=os.environ.get('MC_SENSITIVITY') == '1')
 
     if paragraph is not None:
         document.sections[1].footer.is_linked_to_previous = False
@@ -4153,5 +5788,13 @@ if __name__ == '__main__':
         section.bottom_margin = Cm(2)
         section.left_margin = Cm(3)
         section.right_margin = Cm(1.5)
-    document.save('out.docx')
+    # the check reads the queue, so it runs before save_document flushes it
+    if os.environ.get('MC_CHECK_FORMULAS') == '1' and _deferred_formulas is not None:
+        mismatches, unsupported = check_formula_emitter([e[1] for e in _deferred_formulas])
+        print('formula emitter: {} mismatches, {} unsupported'.format(len(mismatches.rows), unsupported))
+        if mismatches.rows:
+            print(mismatches)
+    save_document('out.docx', formula_workers)
+    if formula_profiler is not None:
+        print(formula_profiler.report())
     print('time: {:,.2f}'.format(time.time() - t))
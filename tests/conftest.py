@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mc
+
+
+@pytest.fixture(scope='session')
+def report_formulas():
+    """
+    LaTeX всех формул отчёта: отчёт строится один раз в отложенном режиме, формулы берутся из очереди.
+    После сборки режим и глобальные переменные mc (разделы модели, документ, стили) возвращаются как были
+    """
+    state = dict(vars(mc))
+    mc.set_deferred_formulas(True)
+    try:
+        mc.main()
+        latex = [e[1] for e in mc._deferred_formulas]
+    finally:
+        mc.set_deferred_formulas(False)
+        for name in [e for e in vars(mc) if e not in state]:
+            delattr(mc, name)
+        for name, value in state.items():
+            setattr(mc, name, value)
+    return latex
@@ -0,0 +1,58 @@
+import numpy
+import pytest
+
+import mc
+from mc import CHAPTER_PARAMS, ReportModel
+
+OUTPUTS = {
+    'P_chistaya_plan': ('chapter_8', 'P_chistaya_plan'),
+    'P_chistaya_fact': ('chapter_8', 'P_chistaya_fact'),
+    'N_kr': ('chapter_10', 'N_kr'),
+    'k_tek_likvid_plan': ('chapter_10', 'k_tek_likvid_plan'),
+    'k_tek_likvid_fact': ('chapter_10', 'k_tek_likvid_fact'),
+    'k_abs_likvid_plan': ('chapter_10', 'k_abs_likvid_plan'),
+    'k_abs_likvid_fact': ('chapter_10', 'k_abs_likvid_fact'),
+}
+
+
+def supported_inputs(model):
+    """
+    Все входы batch_section_1 и их базовые значения
+    """
+    inputs = {k: model.initial_data.param(k) for k in CHAPTER_PARAMS if k.split('.')[0] in mc.BATCH_CHAPTERS}
+    for table in ['materials', 'accessories']:
+        for row in getattr(model.initial_data, table).rows:
+            inputs['{}.{}.cost'.format(table, row['name'])] = row['cost']
+    return inputs
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_batch_section_1_matches_report_model(seed):
+    model = ReportModel().compute_all()
+    generator = numpy.random.default_rng(seed)
+    draws = 25
+    values = {}
+    for name, base in supported_inputs(model).items():
+        values[name] = base * generator.uniform(0.9, 1.1, draws)
+        if name.endswith('_percent'):
+            values[name] = numpy.minimum(values[name], 1.0)
+    results = mc.batch_section_1(model, values)
+
+    for i in range(draws):
+        scalar = ReportModel()
+        for name, v in values.items():
+            scalar.set(name, float(v[i]))
+        for output, (node, attr) in OUTPUTS.items():
+            assert results[output][i] == getattr(scalar.get(node), attr), (output, i)
+
+
+@pytest.mark.parametrize('name', ['N_pl', 'chapter_2.stimulating_salary_percent', 'chapter_9.k_sob', 'chapter_7.P_fact',
+                                  'materials.я.cost', 'materials.а.amount', 'operations.1.cost'])
+def test_batch_section_1_rejects_unsupported_inputs(name):
+    with pytest.raises(ValueError):
+        mc.batch_section_1(ReportModel(), {name: numpy.ones(4)})
+
+
+def test_monte_carlo_rejects_unsupported_inputs():
+    with pytest.raises(ValueError):
+        mc.monte_carlo(draws=10, inputs={'chapter_2.stimulating_salary_percent': (0.9, 1.1)})
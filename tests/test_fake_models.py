@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+import mc
+from mc import CHAPTER_PARAMS, ReportModel
+
+
+def scenarios(count, seed=1):
+    """
+    Базовая модель и модели со случайно изменёнными параметрами, объёмом и ценой материала
+    """
+    rnd = random.Random(seed)
+    result = [{}]
+    for _ in range(count - 1):
+        overrides = {e: CHAPTER_PARAMS[e] * rnd.uniform(0.8, 1.2) for e in rnd.sample(sorted(CHAPTER_PARAMS), 6)}
+        overrides['N_pl'] = rnd.choice([9999, 30_000, 45_000, 52_345])
+        overrides['materials.б.cost'] = rnd.uniform(30, 90)
+        result.append(overrides)
+    return result
+
+
+def model(overrides):
+    m = ReportModel()
+    for name, value in overrides.items():
+        m.set(name, value)
+    return m
+
+
+@pytest.mark.parametrize('overrides', scenarios(12))
+def test_cost_arrays_match_fake_models(overrides):
+    m = model(overrides)
+    fake_models = m.chapter_4.fake_models
+    rnd = random.Random(2)
+    n_values = sorted({1, 2, 3, 450, 2700, 12_345, m.initial_data.N_pl} | set(rnd.sample(range(1, m.initial_data.N_pl), 30)))
+    const, variable = fake_models.cost_arrays(n_values)
+    for i, n in enumerate(n_values):
+        S_sum = fake_models.chapter_4(n).S_sum
+        assert (const[i], variable[i]) == (S_sum.const, S_sum.variable), n
+        assert fake_models.costs(n) == (S_sum.const, S_sum.variable), n
+
+
+def test_cost_table_matches_fake_models():
+    chapter_4 = ReportModel().chapter_4
+    for n, row in zip(chapter_4.N_pl_values, chapter_4.ct1.output_data):
+        assert (row.const, row.variable) == (chapter_4.calc_n(n).const, chapter_4.calc_n(n).variable)
+
+
+@pytest.mark.parametrize('overrides', scenarios(30, seed=3))
+def test_break_even_matches_bin_search(overrides):
+    m = model(overrides)
+    try:
+        chapter_4, chapter_7 = m.chapter_4, m.chapter_7
+    except ZeroDivisionError:
+        pytest.skip('no model for these parameters')
+    assert mc.Chapter_10.break_even(m.initial_data, chapter_4, chapter_7) == mc.Chapter_10.bin_search(m.initial_data, chapter_4, chapter_7)
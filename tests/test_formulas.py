@@ -0,0 +1,218 @@
+import random
+
+import pytest
+from lxml import etree
+
+import mc
+
+ATOMS = ['x', 'y', 'S', 'N', 'k', 'П', 'а', '1', '2', '12', '305', '0.5', '3.14', '\\alpha', '\\gamma', '\\delta', '\\%']
+OPERATORS = ['+', '-', '=', ',', '.', '(', ')', '[', ']', '/', '*', '\\cdot', '\\ ']
+SPACES = ['', '', '', ' ', '  ']
+
+
+def random_formula(rnd, depth=0):
+    parts = []
+    for _ in range(rnd.randint(1, 5)):
+        r = rnd.random()
+        if r < 0.45:
+            item = rnd.choice(ATOMS)
+        elif r < 0.7:
+            item = rnd.choice(OPERATORS)
+        elif r < 0.8 and depth < 2:
+            item = '\\frac{' + random_formula(rnd, depth + 1) + '}{' + random_formula(rnd, depth + 1) + '}'
+        elif r < 0.88 and depth < 2:
+            item = '{' + random_formula(rnd, depth + 1) + '}'
+        elif r < 0.93 and depth < 2:
+            item = '\\sum_{' + random_formula(rnd, depth + 1) + '}^{' + rnd.choice(ATOMS) + '}{' + random_formula(rnd, depth + 1) + '}'
+        else:
+            item = rnd.choice(ATOMS) + "'"
+        if rnd.random() < 0.3 and not item.endswith("'"):
+            for mark in rnd.sample(['_', '^'], rnd.randint(1, 2)):
+                argument = rnd.choice(ATOMS + ['{' + random_formula(rnd, 2) + '}'] if depth < 2 else ATOMS)
+                item += rnd.choice(SPACES) + mark + rnd.choice(SPACES) + argument
+        parts.append(item)
+    return ''.join(e + rnd.choice(SPACES) for e in parts).strip()
+
+
+def random_corpus(n, seed):
+    """
+    Случайные формулы из подмножества LaTeX отчёта, только те, что принимает latex2mathml
+    """
+    rnd = random.Random(seed)
+    corpus = []
+    for latex in dict.fromkeys(random_formula(rnd) for _ in range(n)):
+        try:
+            mc.latex2mathml.converter.convert(latex)
+        except Exception:
+            continue
+        corpus.append(latex)
+    return corpus
+
+
+@pytest.fixture(autouse=True)
+def dependencies():
+    mc.load_report_dependencies()
+
+
+def assert_emitter_matches(corpus):
+    mismatches, unsupported = mc.check_formula_emitter(corpus)
+    assert [e[0] for e in mismatches.rows] == []
+    # the corpus must actually exercise the emitter
+    assert unsupported < len(set(corpus))
+
+
+def test_emitter_matches_xslt_on_report(report_formulas):
+    assert_emitter_matches(report_formulas)
+
+
+def test_report_formulas_leave_no_report_state(report_formulas):
+    assert mc._deferred_formulas is None
+    assert not [e for e in mc.ReportModel.NODES if e in vars(mc)]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_emitter_matches_xslt_on_random_formulas(seed):
+    assert_emitter_matches(random_corpus(1500, seed))
+
+
+@pytest.mark.parametrize('latex', ['a/b', '{a/b}', 'S_{a/b}', '\\frac{a}{b/c}', 'x_ 12', 'x _ 12', 'x^ 12', 'x_%\n12'])
+def test_emitter_leaves_ambiguous_input_to_xslt(latex):
+    with pytest.raises(mc.UnsupportedFormula):
+        mc.latex_to_omml(latex)
+    element, = mc._convert_latex_many([latex])
+    assert etree.tostring(element) == etree.tostring(mc._convert_latex_many_xslt([latex])[0])
+
+
+def test_disk_cache_key_depends_on_conversion_path(tmp_path, monkeypatch):
+    cache = mc.FormulaDiskCache(str(tmp_path))
+    try:
+        monkeypatch.setattr(mc, 'use_formula_emitter', True)
+        emitter = cache.key('x_1')
+        monkeypatch.setattr(mc, 'FORMULA_EMITTER_VERSION', mc.FORMULA_EMITTER_VERSION + 1)
+        changed = cache.key('x_1')
+        monkeypatch.setattr(mc, 'use_formula_emitter', False)
+        xslt = cache.key('x_1')
+    finally:
+        cache.close()
+    assert len({emitter, changed, xslt}) == 3
+
+
+TEMPLATES = ['k_{абс.ликв.\\ план} = \\frac{ $A }{ $B } = $C', 'x = $A + $B \\cdot $C', 'S = 2$A', 'S = ($A)\\%',
+             'x = $A,$B', 'x = $A $B $C', 'x = $A .5', 'x_{$A} = \\frac{$B}{$A}', '$A']
+VALUES = [0, 1, -1, 1.5, -0.004, 1234.5, -1234567.891, 10 ** 9]
+
+
+@pytest.mark.parametrize('emitter', [True, False])
+@pytest.mark.parametrize('latex', TEMPLATES)
+def test_template_matches_substituted_formula(latex, emitter, monkeypatch):
+    monkeypatch.setattr(mc, 'use_formula_emitter', emitter)
+    template = mc.FormulaTemplate(latex)
+    rnd = random.Random(latex)
+    rendered = []
+    for _ in range(15):
+        values = {e: mc.fn(rnd.choice(VALUES), rnd.choice([0, 2, 3])) for e in template.slots}
+        expected = mc.latex_to_word(mc.FormulaTemplate.SLOT.sub(lambda m: values[m.group(1)], latex))
+        rendered.append((template.render(**values), expected))
+    # every render works on its own copy
+    for element, expected in rendered:
+        assert mc._omml_equal(element, expected)
+
+
+@pytest.mark.parametrize('latex', ['x = $A$B', 'x = $A.5', 'x = 3.$A', 'x^$A'])
+def test_template_rejects_slots_merged_with_numbers(latex):
+    with pytest.raises(ValueError):
+        mc.FormulaTemplate(latex)
+
+
+def test_template_requires_every_slot():
+    template = mc.FormulaTemplate('x = \\frac{$A}{$B}')
+    with pytest.raises(KeyError):
+        template.render(A='1')
+
+
+def omml(latex):
+    return mc._convert_latex_many_xslt([latex])[0]
+
+
+def test_memory_cache_returns_copies_and_counts():
+    cache = mc.FormulaCache()
+    element = omml('x_1')
+    expected = etree.tostring(element)
+    assert cache.get('x_1') is None
+    cache.put('x_1', element)
+    element.clear()
+    first = cache.get('x_1')
+    first.clear()
+    assert etree.tostring(cache.get('x_1')) == expected
+    assert cache.stats == {'size': 1, 'max_size': 1024, 'hits': 2, 'misses': 1}
+    cache.clear()
+    assert cache.stats == {'size': 0, 'max_size': 1024, 'hits': 0, 'misses': 0}
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = mc.FormulaCache(3)
+    for latex in ['a', 'b', 'c']:
+        cache.put(latex, omml(latex))
+    cache.get('a')
+    cache.put('d', omml('d'))
+    assert [e for e in 'abcd' if cache.get(e) is not None] == ['a', 'c', 'd']
+    cache.resize(1)
+    assert [e for e in 'abcd' if cache.get(e) is not None] == ['d']
+    cache.resize(0)
+    cache.put('e', omml('e'))
+    assert len(cache) == 0
+
+
+def test_disk_cache_is_shared_between_instances(tmp_path):
+    element = omml('\\frac{x_1}{y}')
+    cache = mc.FormulaDiskCache(str(tmp_path))
+    try:
+        cache.put('\\frac{x_1}{y}', element)
+    finally:
+        cache.close()
+    cache = mc.FormulaDiskCache(str(tmp_path))
+    try:
+        assert etree.tostring(cache.get('\\frac{x_1}{y}')) == etree.tostring(element)
+        assert cache.get('y') is None
+        assert len(cache) == 1
+    finally:
+        cache.close()
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(1, 1000))
+    monkeypatch.setattr(mc.time, 'time', lambda: next(clock))
+    element = omml('x')
+    size = len(etree.tostring(element))
+    cache = mc.FormulaDiskCache(str(tmp_path), max_bytes=3 * size)
+    try:
+        # the same OMML under different keys, so every entry has the same size
+        for latex in ['a', 'b', 'c']:
+            cache.put(latex, element)
+        cache.get('a')
+        cache.put('d', element)
+        assert [e for e in 'abcd' if cache.get(e) is not None] == ['a', 'c', 'd']
+        assert len(cache) == 3
+    finally:
+        cache.close()
+
+
+def test_report_conversion_reuses_disk_cache(tmp_path, monkeypatch):
+    latex_list = ['x_{77} = \\frac{1}{2}', 'a/b']
+    monkeypatch.setattr(mc, 'formula_cache', mc.FormulaCache())
+    try:
+        mc.enable_formula_disk_cache(str(tmp_path))
+        first = mc.latex_to_word_many(latex_list)
+        # a new run: empty memory cache, formulas are not converted again
+        mc.enable_formula_disk_cache(str(tmp_path))
+        monkeypatch.setattr(mc, 'formula_cache', mc.FormulaCache())
+
+        def convert(latex_list):
+            raise AssertionError('converted again: {}'.format(latex_list))
+
+        monkeypatch.setattr(mc, '_convert_latex_many', convert)
+        second = mc.latex_to_word_many(latex_list)
+    finally:
+        mc.disable_formula_disk_cache()
+    assert [etree.tostring(e) for e in second] == [etree.tostring(e) for e in first]
+    assert mc.formula_cache.stats['misses'] == 2
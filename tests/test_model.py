@@ -0,0 +1,146 @@
+import math
+import os
+import subprocess
+import sys
+
+import pytest
+
+import mc
+from mc import CHAPTER_PARAMS, InitialData, ReportModel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def snapshot(model):
+    """
+    Все числовые атрибуты разделов модели и полные затраты Value атрибутов
+    """
+    values = {}
+    for node in ReportModel.NODES:
+        obj = model.get(node)
+        for cls in type(obj).__mro__:
+            for attr in getattr(cls, '__slots__', []):
+                value = getattr(obj, attr, None)
+                if isinstance(value, (int, float)) and not (isinstance(value, float) and math.isnan(value)):
+                    values[node + '.' + attr] = value
+                elif hasattr(value, 'total') and hasattr(value, 'const'):
+                    values[node + '.' + attr + '.total'] = value.total
+    return values
+
+
+def model_inputs():
+    inputs = [('N_pl', 40_000)]
+    initial_data = InitialData()
+    for table in ['materials', 'accessories', 'operations', 'materials_A', 'accessories_A', 'operations_A',
+                  'operations_B', 'materials_C', 'accessories_C', 'operations_C']:
+        t = getattr(initial_data, table)
+        for row in t.rows:
+            for header in t.headers:
+                value = row[header]
+                if header != 'name' and isinstance(value, (int, float)):
+                    inputs.append(('{}.{}.{}'.format(table, row['name'], header), value * 1.1 + (1 if isinstance(value, int) else 0)))
+    inputs += [(name, value * 0.97) for name, value in CHAPTER_PARAMS.items()]
+    return inputs
+
+
+@pytest.mark.parametrize('name,value', model_inputs())
+def test_incremental_set_matches_fresh_model(name, value):
+    model = ReportModel().compute_all()
+    invalidated = model.set(name, value)
+    fresh = ReportModel()
+    fresh.set(name, value)
+    assert snapshot(model.compute_all()) == snapshot(fresh.compute_all())
+    assert invalidated
+    assert set(model.computed) == set(ReportModel.NODES)
+
+
+def test_chapter_params_are_read_by_their_chapter(monkeypatch):
+    reads = {}
+    param = InitialData.param
+
+    def recording_param(self, name):
+        reads.setdefault(name, set()).add(type(sys._getframe(1).f_locals.get('self')).__name__)
+        return param(self, name)
+
+    monkeypatch.setattr(InitialData, 'param', recording_param)
+    ReportModel().compute_all()
+    assert set(reads) == set(CHAPTER_PARAMS)
+    for name, readers in reads.items():
+        assert readers == {ReportModel.NODES[name.split('.')[0]][0].__name__}, name
+
+
+@pytest.mark.parametrize('name', ['chapter_7.P_fact', 'chapter_2_2.new_machines_cost', 'chapter_3.costs', 'chapter_3.nothing',
+                                  'materials.nothing.cost', 'materials.а.nothing', 'nothing'])
+def test_set_rejects_unknown_inputs(name, capsys):
+    model = ReportModel().compute_all()
+    before = snapshot(model)
+    assert model.set(name, 1.0) == []
+    assert capsys.readouterr().out.startswith('error')
+    assert model.initial_data.params == {}
+    assert snapshot(model) == before
+
+
+def test_changes_reproduce_the_model():
+    overrides = {'N_pl': 40_000, 'materials.б.cost': 77, 'accessories.а.cost': 12.5, 'chapter_3.fuel_percent': 0.5}
+    model = ReportModel()
+    for name, value in overrides.items():
+        model.set(name, value)
+    assert model.initial_data.changes() == overrides
+    assert mc.run_scenario(model.initial_data.changes()) == [getattr(model.get(node), attr) for _, node, attr in mc.SCENARIO_METRICS]
+    assert ReportModel().initial_data.changes() == {}
+
+
+def loaded_names(code):
+    """
+    Разделы, которые есть в глобальных переменных mc после выполнения code в отдельном процессе
+    """
+    check = code + '\nprint(",".join(e for e in mc.ReportModel.NODES if e in vars(mc)))'
+    result = subprocess.run([sys.executable, '-c', check], cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return [e for e in result.stdout.splitlines()[-1].split(',') if e]
+
+
+def test_import_builds_no_model():
+    assert loaded_names('import mc') == []
+    assert loaded_names('import mc\nmc.chapter_7') == ['chapter_7']
+
+
+def test_models_are_independent():
+    default = snapshot(ReportModel().compute_all())
+    changed = ReportModel()
+    changed.set('N_pl', 40_000)
+    other = ReportModel()
+    other.set('materials.б.cost', 77)
+    # interleaved computation of several models must not mix their chapters
+    for node in ReportModel.NODES:
+        changed.get(node)
+        other.get(node)
+    assert snapshot(changed) != default and snapshot(other) != default
+    assert snapshot(changed) != snapshot(other)
+    assert snapshot(ReportModel().compute_all()) == default
+
+
+def test_tornado_keeps_product_shares_summing_to_one(monkeypatch):
+    scenarios = []
+    run_scenarios = mc.run_scenarios
+
+    def recording_run_scenarios(e, workers=None):
+        scenarios.extend(e)
+        return run_scenarios(e, 1)
+
+    monkeypatch.setattr(mc, 'run_scenarios', recording_run_scenarios)
+    base = {'chapter_2_1.A_percent': 0.3, 'chapter_2_1.B_percent': 0.45, 'materials.б.cost': 77}
+    table = mc.tornado(base=base)
+    assert len(scenarios) == 1 + 2 * len(CHAPTER_PARAMS) and len(table) == len(CHAPTER_PARAMS)
+    for scenario in scenarios:
+        assert scenario['materials.б.cost'] == 77
+        assert math.isclose(sum(scenario.get(e, CHAPTER_PARAMS[e]) for e in mc.PRODUCT_SHARES), 1)
+    assert table.find('Параметр', 'chapter_2_1.A_percent')['Значение'] == 0.3
+
+
+def test_chapter_computes_only_its_dependencies():
+    model = ReportModel()
+    model.chapter_7.P_fact
+    assert model.computed == ['chapter_1', 'chapter_2', 'chapter_3', 'chapter_4', 'chapter_5', 'chapter_6', 'chapter_7']
+    model.set('chapter_6.k_ob_RPB_percent', 0.4)
+    assert model.computed == ['chapter_1', 'chapter_2', 'chapter_3', 'chapter_4', 'chapter_5']
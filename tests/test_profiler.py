@@ -0,0 +1,50 @@
+import pytest
+from lxml import etree
+
+import mc
+
+
+@pytest.fixture
+def profiler():
+    mc.load_report_dependencies()
+    mc.set_deferred_formulas(True)
+    mc.formula_cache.clear()
+    profiler = mc.enable_formula_profiler()
+    yield profiler
+    mc.set_deferred_formulas(False)
+    mc.disable_formula_profiler()
+
+
+def gen_first(parent, latex_list):
+    for e in mc.formula_elements(latex_list):
+        parent.append(e)
+
+
+def gen_second(parent, latex_list):
+    for e in mc.formula_elements(latex_list):
+        parent.append(e)
+
+
+def stages(profiler, section):
+    return {stage for (s, stage) in profiler.timings.keys() if s == section}
+
+
+@pytest.mark.parametrize('workers', [None, 2])
+def test_deferred_formulas_are_charged_to_their_sections(profiler, workers):
+    parent = etree.Element('parent')
+    gen_first(parent, ['p_{1}', 'p_{2}'])
+    gen_second(parent, ['p_{1}', 'p_{2}'])
+    assert mc.flush_formulas(workers) == 4
+
+    assert profiler.counts == {'gen_first': 2, 'gen_second': 2}
+    # repeats are converted once, for the first section, but appended in their own
+    conversion = 'pool' if workers else 'emit'
+    assert conversion in stages(profiler, 'gen_first')
+    assert conversion not in stages(profiler, 'gen_second')
+    assert {'cache', 'append'} <= stages(profiler, 'gen_second')
+    assert 'other' not in {s for s, _ in profiler.timings.keys()}
+
+
+def test_check_is_not_profiled(profiler):
+    mc.check_formula_emitter(['p_{3}', 'p/q'])
+    assert profiler.timings == {}
@@ -0,0 +1,50 @@
+import math
+
+import mc
+from mc import ReportModel
+
+SCENARIOS = [{}, {'N_pl': 40_000}, {'chapter_2_1.A_percent': 0}, {'materials.б.cost': 77, 'chapter_3.fuel_percent': 0.5},
+             {'chapter_7.price_fact_percent': 0.9}]
+
+
+def rows(table):
+    return [[e if not (isinstance(e, float) and math.isnan(e)) else 'nan' for e in row.data] for row in table.rows]
+
+
+def test_pool_matches_current_process():
+    serial = mc.run_scenarios(SCENARIOS, workers=1)
+    assert rows(mc.run_scenarios(SCENARIOS, workers=2)) == rows(serial)
+    assert [row.data[1:] for i, row in enumerate(serial.rows) if i != 2] == \
+           [tuple(mc.run_scenario(e)) for i, e in enumerate(SCENARIOS) if i != 2]
+
+
+def test_failed_scenario_is_recorded_in_its_row(capsys):
+    table = mc.run_scenarios(SCENARIOS, workers=2)
+    assert len(table) == len(SCENARIOS)
+    failed = table.rows[2]
+    assert 'ZeroDivisionError' in failed['Сценарий']
+    assert all(math.isnan(e) for e in failed.data[1:])
+    assert capsys.readouterr().out.startswith('error, scenario chapter_2_1.A_percent=0 failed')
+
+
+def test_product_mix_rows_satisfy_constraints():
+    table = mc.optimize_product_mix(step=0.25, min_k_tek_likvid=1.0, max_new_machines_cost=10 ** 9, top=3)
+    assert 0 < len(table) <= 3
+    profits = table.get_column('Чистая прибыль')
+    assert profits == sorted(profits, reverse=True)
+    for row in table.rows:
+        assert math.isclose(row['A'] + row['B'] + row['C'], 1) and min(row['A'], row['B'], row['C']) > 0
+        assert row['k_тек.ликв.'] >= 1.0 and row['Новое оборудование'] <= 10 ** 9
+        model = ReportModel()
+        for name, share in zip(mc.PRODUCT_SHARES, (row['A'], row['B'], row['C'])):
+            model.set(name, share)
+        assert (model.chapter_2_9.P_chistaya_plan, model.chapter_2_11.k_tek_likvid_plan) == (row['Чистая прибыль'], row['k_тек.ликв.'])
+
+
+def test_product_mix_constraints_exclude_rows():
+    everything = mc.optimize_product_mix(step=0.25, min_k_tek_likvid=-math.inf, top=100)
+    assert len(everything) == 3
+    cheapest = min(everything.get_column('Новое оборудование'))
+    limited = mc.optimize_product_mix(step=0.25, min_k_tek_likvid=-math.inf, max_new_machines_cost=cheapest, top=100)
+    assert limited.get_column('Новое оборудование') == [cheapest] * len(limited)
+    assert len(mc.optimize_product_mix(step=0.25, min_k_tek_likvid=math.inf)) == 0
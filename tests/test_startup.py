@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT_ONLY = ['docx', 'matplotlib', 'numpy']
+
+
+def output(code):
+    """
+    Последняя строка вывода code в отдельном процессе
+    """
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                            env=dict(os.environ, MPLBACKEND='Agg'))
+    assert result.returncode == 0, result.stderr
+    return result.stdout.splitlines()[-1]
+
+
+def loaded_modules(code):
+    """
+    Тяжёлые модули, загруженные отдельным процессом после выполнения code
+    """
+    return output(code + '\nimport sys\nprint(",".join(e for e in {!r} if e in sys.modules))'.format(REPORT_ONLY))
+
+
+def test_formula_worker_does_not_load_report():
+    assert loaded_modules('import mc\nmc._init_formula_worker()\nmc._convert_latex_chunk(["x_1", "a/b"])\nassert mc.document is None') == ''
+
+
+def test_formula_conversion_does_not_load_report():
+    assert loaded_modules('import mc\nmc.latex_to_word_many(["x_1", "a/b"])\nassert mc.document is None') == ''
+
+
+def test_model_does_not_load_report():
+    assert loaded_modules('import mc\nmc.ReportModel().compute_all()\nmc.chapter_10.N_kr\nmc.run_scenario({"N_pl": 40000})') == ''
+
+
+def test_mml2omml_is_compiled_once_per_process():
+    code = """
+import mc
+counts = []
+mc.latex_to_word('x_1')
+counts.append(mc.mml2omml_compile_count)
+# a/b is left to the xslt, by latex_to_word, latex_to_word_many and with the emitter turned off
+mc.latex_to_word('a/b')
+mc.latex_to_word_many(['c/d', 'y^2', '\\\\frac{1}{2}'])
+mc.use_formula_emitter = False
+mc.latex_to_word('z_3')
+mc.latex_to_word_many(['g/h', 'k_{12}'])
+counts.append(mc.mml2omml_compile_count)
+print(counts)
+"""
+    assert output(code) == '[0, 1]'
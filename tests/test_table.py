@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+import mc
+from course import Table
+
+
+def model_tables():
+    """
+    Таблицы исходных данных и таблица станков раздела 2.2
+    """
+    model = mc.ReportModel()
+    tables = {name: getattr(model.initial_data, name) for name in mc.InitialData.__slots__
+              if isinstance(getattr(model.initial_data, name), Table)}
+    tables['machines'] = model.chapter_2_2.machines
+    return tables
+
+
+def row_sum(table, headers, number=None):
+    s = 0
+    for row in table.rows:
+        product = row[headers[0]]
+        for header in headers[1:]:
+            product = product * row[header]
+        if number is not None:
+            product = product * number
+        s += product
+    return s
+
+
+@pytest.mark.parametrize('name,table', model_tables().items())
+def test_expression_sum_matches_row_sum(name, table):
+    numbers = [e for e in table.headers if all(isinstance(v, (int, float)) for v in table.get_column(e))]
+    for size in (1, 2):
+        for headers in ([e] for e in numbers) if size == 1 else zip(numbers, reversed(numbers)):
+            headers = list(headers)
+            expected = row_sum(table, headers)
+            result = table.calculate_sum('*'.join(headers))
+            assert (result, type(result)) == (expected, type(expected))
+            expected = row_sum(table, headers, 1.5)
+            assert table.calculate_sum('*'.join(headers) + '*1.5') == expected
+
+
+def test_expression_sum_of_random_columns():
+    rnd = random.Random(2)
+    table = Table('name', 'amount', 'cost', 'flag')
+    for i in range(200):
+        table.add_row(str(i), rnd.randint(0, 10 ** 6), rnd.uniform(0, 1e6), rnd.random() < 0.5)
+    for expression in ['amount', 'cost', 'flag', 'amount*cost', 'flag*amount', 'cost*flag*2', '3*amount']:
+        headers = [e for e in expression.split('*') if e in table.headers_map]
+        numbers = [int(e) for e in expression.split('*') if e not in table.headers_map]
+        # numbers here multiply integers or come last, so their position does not change the product
+        assert table.calculate_sum(expression) == row_sum(table, headers, numbers[0] if numbers else None)
+    assert Table('name', 'cost').calculate_sum('cost') == 0
+
+
+def test_expression_sum_rejects_unknown_names(capsys):
+    table = Table('name', 'cost')
+    table.add_row('а', 1.0)
+    assert table.calculate_sum('cost*price') == 0
+    assert capsys.readouterr().out.startswith('error')
+
+
+def test_rows_and_columns_stay_in_sync():
+    table = Table('name', 'cost')
+    table.add_row('а', 1.0)
+    table.add_row('б', 2.0)
+    assert table.column('cost').tolist() == [1.0, 2.0]
+    table.find('name', 'б')['cost'] = 5.0
+    assert table.column('cost').tolist() == [1.0, 5.0]
+    assert table.rows[1].data == ('б', 5.0)
+    table.add_row('в', 3.0)
+    assert table.column('cost').tolist() == [1.0, 5.0, 3.0]
+    with pytest.raises(ValueError):
+        table.column('cost')[0] = 0
+    # columns change only through rows and add_row, which drop the cached arrays
+    assert not hasattr(table, 'columns')
+    records = table.to_numpy()
+    assert records.cost.tolist() == [1.0, 5.0, 3.0] and records.name.tolist() == ['а', 'б', 'в']
+    filtered = table.filter_table(lambda row: row['cost'] > 2)
+    assert [row.data for row in filtered.rows] == [('б', 5.0), ('в', 3.0)]
+    assert all(row.table is filtered for row in filtered.rows)
+    filtered.rows[0]['cost'] = 7.0
+    assert table.find('name', 'б')['cost'] == 5.0
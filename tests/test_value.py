@@ -0,0 +1,222 @@
+import gc
+import random
+
+import numpy
+import pytest
+
+import mc
+from course import FlatValue, Value, ValueBatch
+
+
+def plain_sums(value):
+    """
+    Суммы поддерева без кэша, в том же порядке сложения, что и Value
+    """
+    if value.children is None:
+        return value._const, value._variable
+    const, variable = 0, 0
+    for child in value.children:
+        c, v = plain_sums(child)
+        const += c
+        variable += v
+    return const, variable
+
+
+def walk(value):
+    yield value
+    for child in value.children or ():
+        yield from walk(child)
+
+
+def test_cached_sums_match_plain_sums():
+    rnd = random.Random(3)
+    shared = Value('shared', 1.5, 2.5)
+    roots = [Value('root_{}'.format(i)) for i in range(3)]
+    nodes = list(roots) + [shared]
+    for step in range(600):
+        node = rnd.choice(nodes)
+        action = rnd.random()
+        if action < 0.4:
+            # a new child for a leaf or an already summed node, sometimes the shared subtree
+            child = shared if rnd.random() < 0.05 and node is not shared else Value('v{}'.format(step), rnd.uniform(0, 100), rnd.randint(0, 50))
+            if all(e is not node for e in walk(child)):
+                node.add_child(child)
+                nodes.append(child)
+        elif node.children is None:
+            if action < 0.7:
+                node.const = rnd.uniform(0, 100)
+            else:
+                node.variable = rnd.randint(0, 50)
+        for root in rnd.sample(roots, 2):
+            assert (root.const, root.variable) == plain_sums(root)
+    for node in nodes:
+        assert (node.const, node.variable) == plain_sums(node)
+
+
+def test_dead_parents_are_pruned():
+    shared = Value('shared', 1, 2)
+    kept = []
+    for i in range(1000):
+        tree = Value('tree_{}'.format(i))
+        tree.add_child(shared)
+        tree.const
+        if i % 100 == 0:
+            kept.append(tree)
+    del tree
+    shared.const = 5
+    assert len(shared._parents) == len(kept)
+    assert all(tree.const == 5 for tree in kept)
+
+
+def test_fake_models_do_not_collect_parents():
+    fake_models = mc.chapter_4.fake_models
+    for n in range(1, 3001):
+        fake_models.chapter_4(n)
+    gc.collect()
+    values = [v for v in gc.get_objects() if isinstance(v, Value) and v._parents]
+    dead = max(sum(ref() is None for ref in v._parents) for v in values)
+    # fake models are not kept, dead parents are dropped on the next add_child
+    assert max(len(v._parents) for v in values) <= dead + 2
+    assert dead <= 1
+
+
+def linear_search(value, name):
+    """
+    Поиск по имени без индекса: сам, прямые потомки, затем поддеревья потомков
+    """
+    if name == value.name:
+        return value
+    for child in value.children or ():
+        if child.name == name:
+            return child
+    for child in value.children or ():
+        found = linear_search(child, name)
+        if found is not None:
+            return found
+    return None
+
+
+def test_name_index_matches_linear_search(capsys):
+    rnd = random.Random(5)
+    names = ['n{}'.format(i) for i in range(40)]
+    roots = [Value('root_{}'.format(i)) for i in range(2)]
+    nodes = list(roots)
+    for step in range(400):
+        node = rnd.choice(nodes)
+        # shared subtrees and repeated names are both possible, as in the chapter trees
+        child = rnd.choice(nodes) if rnd.random() < 0.05 else Value(rnd.choice(names), 1, 1)
+        if all(e is not node for e in walk(child)):
+            node.add_child(child)
+            nodes.append(child)
+        for root in roots:
+            name = rnd.choice(names)
+            assert root[name] is linear_search(root, name)
+    for node in nodes:
+        for name in names + ['root_0', 'missing']:
+            assert node[name] is linear_search(node, name)
+    assert roots[0][1] is None
+    assert 'duplicate name' in capsys.readouterr().out
+
+
+def test_shared_value_is_not_a_duplicate(capsys):
+    shared = Value('shared', 1, 2)
+    root = Value('root')
+    root.add_child(Value('a')).add_child(shared)
+    root.add_child(Value('b')).add_child(shared)
+    assert root['shared'] is shared
+    assert capsys.readouterr().out == ''
+
+
+def model_trees(model):
+    """
+    Деревья затрат из разделов модели
+    """
+    trees = {}
+    for node in mc.ReportModel.NODES:
+        obj = model.get(node)
+        for cls in type(obj).__mro__:
+            for attr in getattr(cls, '__slots__', []):
+                value = getattr(obj, attr, None)
+                if isinstance(value, Value) and value.children is not None:
+                    trees[node + '.' + attr] = value
+    return trees
+
+
+def random_tree(seed):
+    rnd = random.Random(seed)
+    root = Value('root')
+    nodes = [root]
+    for i in range(300):
+        nodes.append(rnd.choice(nodes).add_child(Value('v{}'.format(i), rnd.uniform(0, 1000), rnd.choice([0, rnd.uniform(0, 10)]))))
+    return root
+
+
+def assert_same_tree(flat, value, column=None):
+    c, v = flat.sums()
+    if column is not None:
+        c, v = c[:, column], v[:, column]
+    for i, node in enumerate(walk(value)):
+        assert flat.names[flat.name_id[i]] == node.name
+        assert (c[i], v[i]) == (node.const, node.variable)
+
+
+def test_flat_value_matches_value():
+    trees = dict(model_trees(mc.ReportModel()), random=random_tree(1))
+    assert len(trees) > 5
+    for name, value in trees.items():
+        flat = FlatValue.from_value(value)
+        assert_same_tree(flat, value)
+        assert flat.totals()[0] == value.total
+        for deep in range(4):
+            assert_same_tree(flat.head(deep), value.head(deep))
+        for node in walk(value):
+            assert value[node.name] is list(walk(value))[flat[node.name]]
+        assert_same_tree(FlatValue.from_value(flat.to_value()), value)
+
+
+def test_stacked_flat_value_matches_each_tree():
+    models = [mc.ReportModel()]
+    for value in [30, 60, 90]:
+        models.append(mc.ReportModel())
+        models[-1].set('materials.б.cost', value)
+    trees = [m.chapter_3.costs for m in models]
+    flat = FlatValue.from_values(trees)
+    for column, value in enumerate(trees):
+        assert_same_tree(flat, value, column)
+        assert_same_tree(FlatValue.from_value(flat.to_value(column)), value)
+    assert FlatValue.from_values([trees[0], random_tree(2)]) is None
+
+
+def test_value_batch_matches_each_tree():
+    models = [mc.ReportModel()]
+    for value in [30, 60, 90]:
+        models.append(mc.ReportModel())
+        models[-1].set('materials.б.cost', value)
+        models[-1].set('chapter_3.fuel_percent', value / 100)
+    trees = [m.chapter_3.costs for m in models]
+    batch = ValueBatch.from_values(trees)
+    assert batch.size == len(trees)
+    for i, value in enumerate(trees):
+        assert_same_tree(FlatValue.from_value(batch.scenario(i)), value)
+        for node in walk(value):
+            found = batch[node.name]
+            assert (found.const[i], found.variable[i], found.total[i]) == (node.const, node.variable, node.total)
+        for deep in range(3):
+            assert_same_tree(FlatValue.from_value(batch.head(deep).scenario(i)), value.head(deep))
+    assert str(batch).startswith('{}, сценариев: 4'.format(trees[0]._display_name or trees[0].name))
+
+
+def test_value_batch_broadcasts_number_leaves():
+    batch = ValueBatch('root')
+    batch.add_child(ValueBatch('shared', 10, 0))
+    batch.add_child(ValueBatch('scenarios', numpy.array([1., 2., 3.]), 5))
+    assert batch.size == 3
+    assert batch['shared'].size == 1
+    assert batch.total.tolist() == [16., 17., 18.]
+    assert [batch.scenario(i).total for i in range(3)] == [16., 17., 18.]
+    assert str(batch).splitlines() == ['root, сценариев: 3, все: 16.00 .. 18.00',
+                                       '  shared, сценариев: 3, все: 10.00 .. 10.00',
+                                       '  scenarios, сценариев: 3, все: 6.00 .. 8.00']
+    batch.add_child(ValueBatch('other', numpy.zeros(4)))
+    with pytest.raises(ValueError):
+        batch.size